@@ -0,0 +1,282 @@
+""" BENCHMARK
+Headless benchmarks for termwindow.  Every window writes to an in-memory
+sink instead of the terminal, with a fake size, so this runs anywhere (no
+TTY needed) and the numbers do not depend on the terminal emulator.
+
+Prints the results as JSON, e.g.
+
+	python benchmark.py --size 160x48 --storage compact --diff > results.json
+
+Each benchmark runs a number of frames (some drawing, then display()) and
+reports frames per second and bytes written to the terminal per frame.
+
+"""
+
+# Import modules
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+
+# termcolor leaves the colors out when stdout is not a terminal; keep them,
+# so the byte counts are the ones a terminal would get
+os.environ.setdefault('FORCE_COLOR', '1')
+
+from termwindow import Window, Terminal, Thing, StripChart
+
+
+#---------------------------------- SINK -------------------------------------
+
+# Output stream that only counts what is written to it
+class NullSink(object):
+	"""A file-like object that keeps the byte and write counts and throws
+	the data away."""
+	def __init__(self):
+		self.bytes = 0
+		self.writes = 0
+
+	def write(self, data):
+		self.bytes += len(data)
+		self.writes += 1
+
+	def flush(self):
+		pass
+
+	def fileno(self):
+		raise IOError('NullSink is not a file')
+
+
+# make a window of a fake size that writes to a NullSink
+def make_window(width, height, storage, diff, rep=False):
+	"""Returns (window, sink) for a window as big as a width x height
+	terminal."""
+	sink = NullSink()
+	window = Window('cyan', terminal=Terminal(sink, terminfo=False, rep=rep),
+					diff=diff, storage=storage, size=[width-1, height-3],
+					headless=True)
+	return window, sink
+
+
+#------------------------------- BENCHMARKS ----------------------------------
+
+# functions that set up a benchmark on a window, returning a one-frame function
+BENCHMARKS = []
+
+def benchmark(function):
+	BENCHMARKS.append(function)
+	return function
+
+def sin_x_over_x(x):
+	return math.sin(x) / x
+
+@benchmark
+def display(window, rnd, options):
+	"""Reprints the whole stage every frame."""
+	window.plot_area((1,1), (window.mx-1, window.my-1), '#', 'blue')
+	def frame(n):
+		window.invalidate()
+		window.touch_all()
+		window.display()
+	return frame
+
+@benchmark
+def display_idle(window, rnd, options):
+	"""Displays a stage that did not change."""
+	window.plot_area((1,1), (window.mx-1, window.my-1), '#', 'blue')
+	window.display()
+	def frame(n):
+		window.display()
+	return frame
+
+@benchmark
+def areas(window, rnd, options):
+	"""Fills and erases random rectangles."""
+	def frame(n):
+		for k in range(10):
+			c1 = (rnd.randint(-5, window.mx+5), rnd.randint(-5, window.my+5))
+			c2 = (rnd.randint(-5, window.mx+5), rnd.randint(-5, window.my+5))
+			window.plot_area(c1, c2, '#', rnd.choice(window.colors))
+			c3 = (rnd.randint(-5, window.mx+5), rnd.randint(-5, window.my+5))
+			c4 = (rnd.randint(-5, window.mx+5), rnd.randint(-5, window.my+5))
+			window.erase_area(c3, c4)
+		window.display()
+	return frame
+
+@benchmark
+def draw(window, rnd, options):
+	"""Draws a multi-line image at 20 places and erases it again."""
+	image = [' _--.-^---_____/',
+			 '(__`______===== ',
+			 '    V          \\']
+	def frame(n):
+		window.erase()
+		for k in range(20):
+			position = (rnd.randint(-5, window.mx), rnd.randint(0, window.my+2))
+			window.draw(position, image, 'green', ignore=' ')
+		window.display()
+	return frame
+
+@benchmark
+def graph(window, rnd, options):
+	"""Graphs a function (points only) over the whole width."""
+	def frame(n):
+		window.erase()
+		bounds = [-10 - n % 10, 25, -0.3, 1.1]
+		window.graph(sin_x_over_x, bounds=bounds, image='*', color='red',
+					 axis_color='white')
+		window.display()
+	return frame
+
+@benchmark
+def graph_connect_dots(window, rnd, options):
+	"""Graphs a function with its points connected by lines."""
+	def frame(n):
+		window.erase()
+		bounds = [-10 - n % 10, 25, -0.3, 1.1]
+		window.graph(sin_x_over_x, bounds=bounds, connect_dots=True,
+					 image='*', color='red', axis_color='white')
+		window.display()
+	return frame
+
+@benchmark
+def draw_under(window, rnd, options):
+	"""Fills the space between a graph and its axis."""
+	def frame(n):
+		window.erase()
+		bounds = [-10 - n % 10, 25, -0.3, 1.1]
+		CL, orig = window.graph(sin_x_over_x, bounds=bounds, image='*',
+								color='red', axis_color='white')
+		window.draw_under(CL, origin=orig, character='|', color='yellow')
+		window.display()
+	return frame
+
+@benchmark
+def things(window, rnd, options):
+	"""Moves N Things (--things) that turn around at the border."""
+	image = ['/-\\',
+			 '\\-/']
+	things = []
+	for k in range(options.things):
+		position = (rnd.randint(1, window.mx-3), rnd.randint(2, window.my-1))
+		direction = [rnd.choice([-1, 1]), rnd.choice([-1, 0, 1])]
+		thing = Thing(window, position, 'magenta', image=image,
+					  direction=direction)
+		thing.draw()
+		things.append(thing)
+	def frame(n):
+		for thing in things:
+			(x, y) = thing.position
+			(dx, dy) = thing.direction
+			if not 1 <= x + dx <= window.mx - 3:
+				dx = -dx
+			if not 2 <= y + dy <= window.my - 1:
+				dy = -dy
+			thing.move(direction=[dx, dy])
+		window.display()
+	return frame
+
+@benchmark
+def strip_chart(window, rnd, options):
+	"""Pushes one sample per frame to a StripChart."""
+	chart = StripChart(window, '*', 'red', fill='.', fill_color='blue',
+					   axis_color='white')
+	def frame(n):
+		chart.push(sin_x_over_x(n / 4.0 + 0.1))
+		window.display()
+	return frame
+
+@benchmark
+def strip_chart_scroll(window, rnd, options):
+	"""The same, moving the chart with a scroll region (with --diff)."""
+	chart = StripChart(window, '*', 'red', fill='.', fill_color='blue',
+					   axis_color='white', scroll=True)
+	def frame(n):
+		chart.push(sin_x_over_x(n / 4.0 + 0.1))
+		window.display()
+	return frame
+
+
+#---------------------------------- RUN --------------------------------------
+
+# run one benchmark
+def run(function, options):
+	"""Returns the results of one benchmark as a dict."""
+	window, sink = make_window(options.width, options.height,
+							   options.storage, options.diff, options.rep)
+	frame = function(window, random.Random(options.seed), options)
+	window.display()
+
+	# only the frames themselves are counted
+	start_bytes = sink.bytes
+	start_writes = sink.writes
+	start = time.time()
+	for n in range(options.frames):
+		frame(n)
+	seconds = time.time() - start
+
+	frames = options.frames
+	return {
+		'name': function.__name__,
+		'frames': frames,
+		'seconds': seconds,
+		'fps': frames / seconds if seconds > 0 else None,
+		'bytes_per_frame': (sink.bytes - start_bytes) / float(frames),
+		'writes_per_frame': (sink.writes - start_writes) / float(frames),
+	}
+
+# read the command line
+def parse_args(argv):
+	parser = argparse.ArgumentParser(description='Headless termwindow benchmarks.')
+	parser.add_argument('--size', default='80x24',
+						help='fake terminal size, COLUMNSxLINES (default: 80x24)')
+	parser.add_argument('--storage', default='strings',
+						choices=['strings', 'compact', 'numpy'])
+	parser.add_argument('--diff', action='store_true',
+						help='use the differential display')
+	parser.add_argument('--rep', action='store_true',
+						help='send runs of a character with REP')
+	parser.add_argument('--frames', type=int, default=100,
+						help='frames per benchmark (default: 100)')
+	parser.add_argument('--things', type=int, default=50,
+						help='number of Things to move (default: 50)')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--only', action='append', default=None,
+						metavar='NAME', help='run only this benchmark (repeatable)')
+	parser.add_argument('--list', action='store_true',
+						help='list the benchmarks and exit')
+	options = parser.parse_args(argv)
+	options.width, options.height = [int(n) for n in options.size.split('x')]
+	return options
+
+def main(argv=None):
+	options = parse_args(sys.argv[1:] if argv is None else argv)
+	if options.list:
+		for function in BENCHMARKS:
+			print('%-20s %s' % (function.__name__, function.__doc__))
+		return
+
+	results = []
+	for function in BENCHMARKS:
+		if options.only and function.__name__ not in options.only:
+			continue
+		results.append(run(function, options))
+
+	report = {
+		'python': platform.python_version(),
+		'size': [options.width, options.height],
+		'storage': options.storage,
+		'diff': options.diff,
+		'rep': options.rep,
+		'frames': options.frames,
+		'things': options.things,
+		'benchmarks': results,
+	}
+	json.dump(report, sys.stdout, indent=2, sort_keys=True)
+	sys.stdout.write('\n')
+
+if __name__ == '__main__':
+	main()
@@ -6,21 +6,1567 @@ terminal window.  Plots ASCII characters in an [x][y] coordinate system.
 
 # Import modules
 import os
-import subprocess
-from time import sleep
-from copy import deepcopy
-from termcolor import colored, cprint
+import sys
+import json
+import math
+import struct
+import threading
+from time import sleep, time
+from array import array
+from bisect import bisect_right
+from itertools import compress, count, groupby
+from operator import ne
+
+# Thread-safe queue (named Queue in Python 2)
+try:
+	import queue
+except ImportError:
+	import Queue as queue
+
+# NumPy is optional (only needed for storage='numpy')
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# Size used when the terminal's size is unknown (or in headless mode)
+DEFAULT_SIZE = (80, 24)
+
+# get the size of the terminal
+def terminal_size(stream=None):
+	"""Returns the size of the terminal as (columns, lines).
+
+	The COLUMNS and LINES environment variables win if they are set.
+	Otherwise the terminal of stream (or of stdout, stdin or stderr) is
+	asked with the TIOCGWINSZ ioctl.  Falls back to DEFAULT_SIZE.
+	"""
+	columns, lines = DEFAULT_SIZE
+	try:
+		return (int(os.environ['COLUMNS']), int(os.environ['LINES']))
+	except (KeyError, ValueError):
+		pass
+
+	try:
+		import fcntl
+		import termios
+	except ImportError:
+		return columns, lines
+	for f in [stream, sys.stdout, sys.stdin, sys.stderr]:
+		try:
+			data = fcntl.ioctl(f.fileno(), termios.TIOCGWINSZ, b'\0' * 8)
+			(rows, cols) = struct.unpack('hhhh', data)[:2]
+		except Exception:
+			continue
+		if rows > 0 and cols > 0:
+			return cols, rows
+	return columns, lines
+
+# the terminal's columns (WIDTH) and lines less one (HEIGHT), as computed at
+# import by earlier versions; now looked up the first time they are used
+def __getattr__(name):
+	if name in ('WIDTH', 'HEIGHT'):
+		global WIDTH, HEIGHT
+		(columns, lines) = terminal_size()
+		(WIDTH, HEIGHT) = (columns, lines - 1)
+		return globals()[name]
+	raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+# (module __getattr__ needs Python 3.7)
+if sys.version_info < (3, 7):
+	__getattr__('WIDTH')
+
+# termcolor is imported the first time something is colored
+_colored = None
+
+# color a string (termcolor.colored())
+def colored(text, color=None, on_color=None, attrs=None):
+	"""Returns text with the escape sequences for color, on_color and
+	attrs, from termcolor.colored()."""
+	global _colored
+	if _colored is None:
+		from termcolor import colored as _colored
+	return _colored(text, color=color, on_color=on_color, attrs=attrs)
+
+# Output stream for headless windows
+class _NullStream(object):
+	"""A file-like object that throws away everything written to it."""
+	def write(self, data):
+		pass
+
+	def flush(self):
+		pass
+
+	def fileno(self):
+		raise IOError('headless window')
+
+# ANSI strings for the terminal capabilities we use (fallback for terminfo)
+ANSI_CAPS = {
+	'clear' : '\x1b[H\x1b[2J',		# clear screen and home cursor
+	'home'  : '\x1b[H',				# cursor to top left corner
+	'civis' : '\x1b[?25l',			# hide cursor
+	'cnorm' : '\x1b[?25h',			# show cursor
+	'smcup' : '\x1b[?1049h',		# enter alternate screen
+	'rmcup' : '\x1b[?1049l',		# exit alternate screen
+	'sgr0'  : '\x1b[0m',			# reset colors and attributes
+}
+
+# Synchronized output (terminal holds the frame until the end bracket)
+SYNC_BEGIN = '\x1b[?2026h'
+SYNC_END = '\x1b[?2026l'
+
+# ANSI relative cursor motion (used with the ANSI cup only), see
+# Terminal.motion()
+CURSOR_UP = '\x1b[%sA'
+CURSOR_DOWN = '\x1b[%sB'
+CURSOR_FORWARD = '\x1b[%sC'
+CURSOR_BACK = '\x1b[%sD'
+
+# Repeat the last printed character n more times (REP)
+REPEAT = '\x1b[%db'
+
+# Move a rectangle of text to the left: enable left/right margins, set the
+# scroll region (DECSTBM, DECSLRM), delete columns at its left edge (DECDC)
+# and reset the margins again
+SCROLL_LEFT = '\x1b[?69h\x1b[%d;%dr\x1b[%d;%ds\x1b[%d;%dH\x1b[%d\'~' \
+			  '\x1b[s\x1b[r\x1b[?69l'
+
+# longest cursor motion sequence worth comparing with reprinting cells
+MAX_MOTION = 10
+
+# fill in the count of a relative motion (1 is the default, so left out)
+def _csi(sequence, n):
+	return sequence % (n if n != 1 else '')
+
+
+# Output to the terminal
+class Terminal(object):
+	"""
+	Writes frames to a terminal.
+
+	Capabilities are resolved once -- from terminfo when the output is a
+	terminal and curses is available, otherwise from the built-in ANSI
+	strings.  Everything written during a frame is collected in a buffer
+	and sent to the stream with a single write() in end_frame().
+
+		stream     -- file-like object to write to (default: sys.stdout)
+		terminfo   -- look capabilities up in terminfo (default: True)
+		alt_screen -- draw on the alternate screen, so the terminal content
+					  is restored on exit (default: False)
+		sync       -- wrap each frame in synchronized-output brackets so the
+					  terminal never shows a half-drawn frame (default: True)
+		rep        -- print runs of the same character with REP (default:
+					  if terminfo says the terminal has it)
+
+	The cursor position is followed during a frame, and move() picks the
+	shortest way to get to a cell, like curses' mvcur: absolute addressing,
+	relative moves, or carriage return and line feeds.
+
+	"""
+	def __init__(self, stream=None, terminfo=True, alt_screen=False, sync=True,
+				 rep=None):
+		self.stream = sys.stdout if stream is None else stream
+		self.alt_screen = alt_screen
+		self.sync = sync
+		self.rep = False
+
+		# resolve capabilities
+		self.caps = dict(ANSI_CAPS)
+		self._cup = '\x1b[%d;%dH'		# fast path for ANSI cursor addressing
+		self._cup_terminfo = None		# terminfo cup, if not plain ANSI
+		self._cup_cache = {}
+		if terminfo:
+			self._load_terminfo()
+		if rep is not None:
+			self.rep = rep
+
+		# buffer for the frame being built
+		self._buffer = []
+		self._frame_start = 0
+
+		# cursor position, while it is known (see write())
+		self._row = None
+		self._col = None
+
+		# output counters (see FrameStats)
+		self.bytes_written = 0
+		self.flush_seconds = 0.0
+
+	# look capabilities up in the terminfo database
+	def _load_terminfo(self):
+		"""Replaces the ANSI capabilities with the terminal's own, if known."""
+		try:
+			import curses
+			fd = self.stream.fileno()
+			if not os.isatty(fd):
+				return
+			curses.setupterm(fd=fd)
+		except Exception:
+			return
+
+		for name in self.caps:
+			cap = curses.tigetstr(name)
+			if cap:
+				self.caps[name] = cap.decode('latin-1') if not isinstance(cap, str) else cap
+		self.rep = bool(curses.tigetstr('rep'))
+
+		# use the fast format string if cup is the usual ANSI sequence
+		cup = curses.tigetstr('cup')
+		if cup:
+			if curses.tparm(cup, 1, 2) != '\x1b[2;3H'.encode('latin-1'):
+				self._cup_terminfo = cup
+
+	# get the sequence that moves the cursor to (row, col), counting from 0
+	def cup(self, row, col):
+		"""Returns the escape sequence that moves the cursor to (row, col)."""
+		if self._cup_terminfo is None:
+			return self._cup % (row + 1, col + 1)
+		try:
+			return self._cup_cache[(row, col)]
+		except KeyError:
+			import curses
+			seq = curses.tparm(self._cup_terminfo, row, col)
+			if not isinstance(seq, str):
+				seq = seq.decode('latin-1')
+			self._cup_cache[(row, col)] = seq
+			return seq
+
+	# get the shortest sequence that moves the cursor from one cell to another
+	def motion(self, row, col, from_row=None, from_col=None):
+		"""Returns the shortest escape sequence that moves the cursor from
+		(from_row, from_col) to (row, col), or the cup sequence if the
+		cursor position is not known."""
+		cup = self.cup(row, col)
+		if from_row is None or self._cup_terminfo is not None:
+			return cup
+		if row == from_row:
+			# (moving forward on the same row is always cheapest relative)
+			if col > from_col:
+				return _csi(CURSOR_FORWARD, col - from_col)
+			if col == from_col:
+				return ''
+
+		if row > from_row:
+			vertical = _csi(CURSOR_DOWN, row - from_row)
+		elif row < from_row:
+			vertical = _csi(CURSOR_UP, from_row - row)
+		else:
+			vertical = ''
+		if col > from_col:
+			horizontal = _csi(CURSOR_FORWARD, col - from_col)
+		elif col < from_col:
+			horizontal = _csi(CURSOR_BACK, from_col - col)
+		else:
+			horizontal = ''
+		forward = _csi(CURSOR_FORWARD, col) if col else ''
+
+		candidates = [cup, vertical + horizontal, '\r' + vertical + forward]
+		if row > from_row:
+			# (a line feed after a carriage return is safe with or
+			# without the tty's newline translation)
+			candidates.append('\r' + '\n' * (row - from_row) + forward)
+		return min(candidates, key=len)
+
+	# add text to the frame buffer
+	def write(self, text, cells=None):
+		"""Adds text to the frame being built.
+
+		cells is the number of columns the text moves the cursor; without
+		it the cursor position is unknown until the next move().  (Do not
+		give it for text that reaches the last column, where terminals
+		differ in where they leave the cursor.)
+		"""
+		self._buffer.append(text)
+		if cells is None:
+			self._row = None
+		elif self._row is not None:
+			self._col += cells
+
+	# add a cursor movement to the frame buffer
+	def move(self, row, col):
+		"""Adds a cursor movement to (row, col) to the frame being built."""
+		self._buffer.append(self.motion(row, col, self._row, self._col))
+		(self._row, self._col) = (row, col)
+
+	# move part of the screen to the left
+	def scroll_left(self, top, bottom, left, right, n=1):
+		"""Adds the sequence that moves the text in rows top..bottom,
+		columns left..right (counting from 0) n columns to the left, leaving
+		the last n columns blank.
+
+		This uses left/right margins (DECSLRM) and DECDC, which xterm and
+		compatible terminals have but many others do not.
+		"""
+		self._buffer.append(SCROLL_LEFT % (top+1, bottom+1, left+1, right+1,
+										   top+1, left+1, n))
+		self._row = None
+
+	# send the buffer to the stream in one write
+	def flush(self):
+		"""Writes everything buffered so far with one write() call."""
+		if self._buffer:
+			data = ''.join(self._buffer)
+			del self._buffer[:]
+			start = time()
+			self.stream.write(data)
+			self.stream.flush()
+			self.flush_seconds += time() - start
+			self.bytes_written += len(data)
+
+	# start building a frame
+	def begin_frame(self):
+		"""Starts a frame (opens the synchronized-output bracket)."""
+		self._frame_start = len(self._buffer)
+		self._row = None
+		if self.sync:
+			self._buffer.append(SYNC_BEGIN)
+
+	# finish a frame and send it
+	def end_frame(self):
+		"""Ends a frame (closes the synchronized-output bracket) and flushes.
+
+		An empty frame sends nothing at all.
+		"""
+		if self.sync:
+			if len(self._buffer) == self._frame_start + 1:
+				self._buffer.pop()
+			else:
+				self._buffer.append(SYNC_END)
+		self.flush()
+
+	# prepare the terminal for drawing
+	def start(self):
+		"""Enters the alternate screen (if wanted), clears it and hides the
+		cursor."""
+		if self.alt_screen:
+			self._buffer.append(self.caps['smcup'])
+		self._buffer.append(self.caps['clear'])
+		self._buffer.append(self.caps['civis'])
+		self.flush()
+
+	# give the terminal back
+	def stop(self):
+		"""Resets colors, shows the cursor and leaves the alternate screen."""
+		self._buffer.append(self.caps['sgr0'])
+		self._buffer.append(self.caps['cnorm'])
+		if self.alt_screen:
+			self._buffer.append(self.caps['rmcup'])
+		self.flush()
+
+	# make cursor invisible
+	def hide_cursor(self):
+		"""Sets cursor to invisible."""
+		self._buffer.append(self.caps['civis'])
+		self.flush()
+
+	# make cursor visible again
+	def show_cursor(self):
+		"""Sets cursor back to visible."""
+		self._buffer.append(self.caps['cnorm'])
+		self.flush()
+
+
+#--------------------------- COMPACT STORAGE ---------------------------------
+
+# A compact cell is a single integer: the style id in the high bits and the
+# character's code point in the low GLYPH_BITS bits.
+GLYPH_BITS = 21
+GLYPH_MASK = (1 << GLYPH_BITS) - 1
+MAX_STYLES = 1 << (32 - GLYPH_BITS)
+
+# a compact cell that is never drawn (no character has this code point), for
+# cells of Window._shown whose content is unknown
+UNKNOWN_CELL = 0xFFFFFFFF
+
+# style id -> (color, on_color, attrs), or a raw string printed as-is
+# (style id 0 is a plain character, printed as-is)
+_styles = [None]
+_style_ids = {}
+
+# compact cell -> the string that prints it
+_cell_text = {}
+
+# printed cell string -> (style prefix, text), see _encode_cells()
+_unpainted = {}
+
+try:
+	unichr
+except NameError:
+	unichr = chr
+
+# get the id of a style (or of a raw string), registering it if it is new
+def _style_id(key):
+	"""Returns the small-integer id for a style key."""
+	try:
+		return _style_ids[key]
+	except KeyError:
+		if len(_styles) >= MAX_STYLES:
+			raise ValueError('too many distinct styles for compact storage')
+		_style_ids[key] = len(_styles)
+		_styles.append(key)
+		return _style_ids[key]
+
+# pack a character and its style into a compact cell
+def compact_cell(character, style=None):
+	"""Returns the compact (integer) cell for a character in a Style.
+
+	Without a style the character is stored plain and printed as-is.
+	Anything that is not a single character (e.g. an already colored
+	string) is stored as a raw string and printed as-is.
+	"""
+	if len(character) != 1:
+		return _style_id(character) << GLYPH_BITS
+	if style is None:
+		return ord(character)
+	return (style.id << GLYPH_BITS) | ord(character)
+
+# return a string cell unchanged (the string storage counterpart of cell_text)
+def _same(cell):
+	return cell
+
+# unpack a compact cell into the string that prints it
+def cell_text(cell):
+	"""Returns the (colored) string for a compact cell."""
+	try:
+		return _cell_text[cell]
+	except KeyError:
+		style = _styles[cell >> GLYPH_BITS]
+		if style is None or isinstance(style, tuple):
+			code = cell & GLYPH_MASK
+			text = chr(code) if code < 128 else unichr(code)
+			if style is not None:
+				text = Style(*style).paint(text)
+		else:
+			text = style
+		_cell_text[cell] = text
+		return text
+
+
+#-------------------------------- STYLES -------------------------------------
+
+# escape sequence that ends every colored string
+RESET = '\x1b[0m'
+
+
+# Reusable text style
+class Style(object):
+	"""
+	A color, on_color and attrs combination, resolved once.
+
+	Pass a Style to the plot/draw/area methods of a Window with style= to
+	skip parsing the color arguments on every call:
+
+		red = Style('red', attrs=['bold'])
+		window.plot_area((1,1), (10,5), '#', style=red)
+
+	An unknown color, on_color or attribute raises KeyError (as colored()
+	would).  Styles are interned, so Style('red') is Style('red').  Each
+	style keeps its escape prefix (self.prefix, worked out when it is first
+	used), its compact-storage id (self.id), and the colored string of every
+	character it has painted.
+
+	"""
+	_interned = {}
+
+	def __new__(cls, color=None, on_color=None, attrs=None):
+		key = (color, on_color, tuple(attrs) if attrs else ())
+		try:
+			return cls._interned[key]
+		except KeyError:
+			pass
+
+		# check the names now (colored() would only fail when painting)
+		if key != (None, None, ()):
+			from termcolor import COLORS, HIGHLIGHTS, ATTRIBUTES
+			if color is not None and color not in COLORS:
+				raise KeyError(color)
+			if on_color is not None and on_color not in HIGHLIGHTS:
+				raise KeyError(on_color)
+			for attr in key[2]:
+				if attr not in ATTRIBUTES:
+					raise KeyError(attr)
+
+		self = object.__new__(cls)
+		(self.color, self.on_color, self.attrs) = key
+		self.key = key
+		self._painted = {}
+		self._prefix = '' if key == (None, None, ()) else None
+
+		self.id = _style_id(key)
+		cls._interned[key] = self
+		return self
+
+	def __repr__(self):
+		return 'Style(%r, %r, %r)' % self.key
+
+	# escape prefix -- colored() output without the text and the reset
+	@property
+	def prefix(self):
+		if self._prefix is None:
+			prefix = colored('', color=self.color, on_color=self.on_color,
+							 attrs=list(self.attrs) or None)
+			if prefix.endswith(RESET):
+				prefix = prefix[:-len(RESET)]
+			self._prefix = prefix
+		return self._prefix
+
+	# get the colored string for a character
+	def paint(self, character):
+		"""Returns character in this style (the same string as colored(),
+		or just the character for the plain Style())."""
+		try:
+			return self._painted[character]
+		except KeyError:
+			if self.key == (None, None, ()):
+				self._painted[character] = character
+				return character
+			text = colored(character, color=self.color, on_color=self.on_color,
+						   attrs=list(self.attrs) or None)
+			self._painted[character] = text
+			if text == self.prefix + character + RESET:
+				_unpainted[text] = (self.prefix, character)
+			return text
+
+	# get the compact-storage cell for a character
+	def cell(self, character):
+		"""Returns the compact (integer) cell of character in this style."""
+		return compact_cell(character, self)
+
+
+# join a run of cell strings, changing the style only where it changes
+def _encode_cells(texts, rep=False):
+	"""Returns the string that prints a run of cell strings (from
+	cell_text() or string storage).
+
+	Each painted cell carries its own escape prefix and reset.  Here the
+	prefix is only sent when it differs from the previous cell's, and the
+	reset only before a different style and once at the end of the run,
+	so e.g. a row of red '*' costs one prefix and one reset.  Strings that
+	were not painted by a Style are printed as they are.
+
+	With rep=True a long run of the same character is sent as the
+	character and a REP sequence.
+	"""
+	out = []
+	append = out.append
+	current = ''
+	last = None
+	repeats = 0
+	for text in texts:
+		# the same string as the previous cell (e.g. in a filled area)
+		if text is last:
+			repeats += 1
+			continue
+		if repeats:
+			append(_repeat(glyph, repeats, rep))
+			repeats = 0
+		last = text
+		try:
+			(prefix, glyph) = _unpainted[text]
+		except KeyError:
+			if '\x1b' in text:
+				prefix = None
+			else:
+				prefix = ''
+				_unpainted[text] = (prefix, text)
+			glyph = text
+		if prefix != current:
+			if current:
+				append(RESET)
+			current = prefix or ''
+			append(current)
+		append(glyph)
+	if repeats:
+		append(_repeat(glyph, repeats, rep))
+	if current:
+		append(RESET)
+	return ''.join(out)
+
+# print a character n more times
+def _repeat(glyph, n, rep):
+	"""Returns the string that prints glyph n more times (with REP if rep
+	is True and that is shorter)."""
+	if rep and len(glyph) == 1:
+		sequence = REPEAT % n
+		if len(sequence) < n:
+			return sequence
+	return glyph * n
+
+# find the runs of cells of a row to print
+def _changed_runs(terminal, row, new, old, text=_same, rep=False):
+	"""Returns the (start, end) runs of the cells that differ between the
+	rows (lists of cells) new and old, as printed at terminal row row.
+
+	A short gap of unchanged cells between two runs is printed along with
+	them when that takes fewer bytes than moving the cursor over it.
+	"""
+	runs = []
+	for x in compress(count(), map(ne, new, old)):
+		if runs:
+			(left, right) = runs[-1]
+			if x == right:
+				runs[-1] = (left, x+1)
+				continue
+			# (every cell takes at least a byte, so long gaps are skipped)
+			if x - right <= MAX_MOTION:
+				motion = len(terminal.motion(row, x, row, right))
+				if x - right <= motion and \
+				   len(_encode_cells([text(cell) for cell in new[right:x]],
+									 rep)) <= motion:
+					runs[-1] = (left, x+1)
+					continue
+		runs.append((x, x+1))
+	return runs
+
+
+#------------------------------ SNAPSHOTS ------------------------------------
+
+# Stage whose columns are shared with snapshots until they are written
+class SharedGrid(list):
+	"""
+	A list of columns (like Window.stage) that shares its columns with
+	snapshots (like Window.background) until they are written.
+
+	A shared column is copied the first time it is looked up with grid[x],
+	so writing through grid[x][y] never changes a snapshot.  Making a grid
+	from a snapshot, or a snapshot from a grid, only copies the list of
+	column references -- the cells are only copied for the columns that
+	are written afterwards.  Code that only reads a column should use
+	grid.column(x), which never copies it.
+
+	"""
+	def __init__(self, columns, shared=True):
+		list.__init__(self, columns)
+		self._shared = [shared] * len(self)
+
+	def __getitem__(self, x):
+		if isinstance(x, slice):
+			return list.__getitem__(self, x)
+		column = list.__getitem__(self, x)
+		if self._shared[x]:
+			column = column[:]
+			list.__setitem__(self, x, column)
+			self._shared[x] = False
+		return column
+
+	def __setitem__(self, x, column):
+		list.__setitem__(self, x, column)
+		if not isinstance(x, slice):
+			self._shared[x] = False
+
+	# get a column to read from
+	def column(self, x):
+		"""Returns column x without copying it, even if it is shared (so it
+		must not be written to)."""
+		return list.__getitem__(self, x)
+
+	# take a snapshot that shares every column with the grid
+	def snapshot(self):
+		"""Returns a list of the grid's columns, to be kept as a snapshot.
+
+		Every column becomes shared, so the grid copies a column before
+		its next write.
+		"""
+		self._shared = [True] * len(self)
+		return list(self)
+
+	# use a snapshot's column in place of one of the grid's columns
+	def share(self, x, column):
+		"""Makes column x of the grid the (shared) column of a snapshot."""
+		list.__setitem__(self, x, column)
+		self._shared[x] = True
+
+
+#------------------------------- FRAMES --------------------------------------
+
+# Paces animated drawing at a target frame rate
+class FrameScheduler(object):
+	"""
+	Coalesces animated drawing (the delay= of plot_list(), connect_dots(),
+	draw_under(), etc.) into frames at a target frame rate.
+
+	Each animated change calls step(delay).  The changes keep their own
+	timeline -- the sum of their delays -- but the window is only
+	displayed when that timeline reaches the next frame, so 200 points
+	drawn with delay=0.001 take 0.2 seconds and about 12 frames at 60 fps,
+	instead of 200 full repaints.
+
+	Frame statistics:
+		self.frames    -- frames displayed
+		self.steps     -- changes submitted with step()
+		self.late      -- frames displayed more than one interval late
+		self.dropped   -- frame slots skipped because drawing fell behind
+
+	"""
+	def __init__(self, window, fps=60):
+		self.window = window
+		self.fps = fps
+		self.interval = 1.0 / fps
+
+		self._due = 0.0			# when the latest change is due on screen
+		self._next_frame = 0.0	# when the next frame is due
+		self._pending = False	# changes not displayed yet
+		self._last_step = 0.0	# when the previous step() returned
+
+		self.frames = 0
+		self.steps = 0
+		self.late = 0
+		self.dropped = 0
+
+	# submit one change of an animation
+	def step(self, delay=0):
+		"""Records a change that should be on screen delay seconds after the
+		previous one, and displays a frame once one is due."""
+		now = time()
+		self.steps += 1
+		self._pending = True
+
+		# start a new timeline if nothing was drawn for a while
+		if now - self._last_step > self.interval:
+			self._due = now
+			self._next_frame = now
+
+		# skip the frame slots the timeline fell behind by
+		elif self._due < now - self.interval:
+			missed = int((now - self._due) / self.interval)
+			self.dropped += missed
+			self._due += missed * self.interval
+			self._next_frame += missed * self.interval
+		self._due += delay
+
+		if self._due >= self._next_frame:
+			self._wait(self._due)
+			self.flush(self._due)
+		self._last_step = time()
+
+	# display everything that is still pending
+	def finish(self):
+		"""Waits until the last change is due and displays it."""
+		if self._pending:
+			self._wait(self._due)
+			self.flush(self._due)
+
+	# sleep until a point in time
+	def _wait(self, until):
+		"""Sleeps until the time.time() value until, if it is in the future."""
+		wait = until - time()
+		if wait > 0:
+			sleep(wait)
+
+	# display a frame now
+	def flush(self, deadline=None):
+		"""Displays the window and schedules the next frame.
+
+		deadline is when the frame was due; a frame displayed more than one
+		interval after it counts as late.
+		"""
+		now = time()
+		if deadline is None:
+			deadline = now
+		elif now > deadline + self.interval:
+			self.late += 1
+		self._next_frame = deadline + self.interval
 
-# Get size of terminal
-WIDTH = int( subprocess.check_output(['tput','cols']) )
-HEIGHT = int( subprocess.check_output(['tput','lines']) ) - 1
+		self.window.display()
+		self.frames += 1
+		self._pending = False
+
+	# get the frame statistics
+	def stats(self):
+		"""Returns the frame statistics as a dict."""
+		return {'fps': self.fps, 'frames': self.frames, 'steps': self.steps,
+				'late': self.late, 'dropped': self.dropped}
+
+
+# most ticks a RenderLoop runs back to back to catch up
+MAX_CATCH_UP = 5
+
+# Drives a Window from an asyncio event loop
+class RenderLoop(object):
+	"""
+	Runs a Window's tick handlers at a fixed timestep on an asyncio event
+	loop, and displays the window only when something changed.
+
+	Between ticks the loop just sleeps (until the next tick, or until there
+	is input to read), so an idle window costs nothing.  Make one with
+	Window.start() inside a running asyncio program, or use Window.run().
+
+	If the handlers fall more than MAX_CATCH_UP ticks behind, the missed
+	ticks are skipped rather than run back to back.  An exception in a
+	handler stops the loop and is set on self.done.
+
+		self.tps     -- ticks per second
+		self.ticks   -- ticks run so far
+		self.skipped -- ticks skipped because the handlers fell behind
+		self.done    -- asyncio Future that is resolved by stop()
+
+	"""
+	def __init__(self, window, tps=20, loop=None, input=None):
+		import asyncio
+		self.window = window
+		self.tps = tps
+		self.dt = 1.0 / tps
+		if loop is None:
+			# (get_running_loop() is new in Python 3.7)
+			try:
+				loop = asyncio.get_running_loop()
+			except AttributeError:
+				loop = asyncio.get_event_loop()
+		self.loop = loop
+		self.input = input
+		self.ticks = 0
+		self.skipped = 0
+		self.done = self.loop.create_future()
+
+		self._handle = None
+		self._next_tick = self.loop.time()
+		if input is not None:
+			self.loop.add_reader(input.fileno(), self._read)
+		self._handle = self.loop.call_soon(self._wake)
+
+	# run all the ticks that are due, then sleep until the next one
+	def _wake(self):
+		"""Runs the due ticks, displays the window if it changed and
+		schedules the next wake-up."""
+		now = self.loop.time()
+		behind = int((now - self._next_tick) / self.dt)
+		if behind >= MAX_CATCH_UP:
+			self.skipped += behind
+			self._next_tick += behind * self.dt
+		try:
+			while self._next_tick <= now:
+				for handler in list(self.window._tick_handlers):
+					handler(self.dt)
+				self._next_tick += self.dt
+				self.ticks += 1
+			self._redraw()
+		except Exception as e:
+			self._fail(e)
+			return
+		self._handle = self.loop.call_at(self._next_tick, self._wake)
+
+	# pass input on to the input handlers
+	def _read(self):
+		"""Reads what is waiting on the input and passes it to the input
+		handlers (see Window.on_input())."""
+		data = os.read(self.input.fileno(), 1024)
+		if not data:
+			self.loop.remove_reader(self.input.fileno())
+			return
+		try:
+			for handler in list(self.window._input_handlers):
+				handler(data)
+			self._redraw()
+		except Exception as e:
+			self._fail(e)
+
+	# display the window only if something was drawn
+	def _redraw(self):
+		"""Displays the window if it changed since the last display."""
+		if self.window.is_dirty():
+			self.window.display()
+
+	# stop ticking
+	def stop(self):
+		"""Stops the loop's ticks and input, and resolves self.done."""
+		if self._handle is not None:
+			self._handle.cancel()
+			self._handle = None
+		if self.input is not None:
+			self.loop.remove_reader(self.input.fileno())
+		if not self.done.done():
+			self.done.set_result(self.ticks)
+
+	# stop because a handler raised an exception
+	def _fail(self, exception):
+		"""Stops the loop and sets exception on self.done (so that run()
+		raises it)."""
+		if not self.done.done():
+			self.done.set_exception(exception)
+		self.stop()
+
+
+# the Window methods that can be called on a RenderThread to queue them
+RENDER_COMMANDS = frozenset([
+	'erase', 'delete', 'save_snapshot', 'restore_snapshot', 'delete_snapshot',
+	'set_background', 'touch_all',
+	'plot_point', 'erase_point', 'delete_point',
+	'plot_list', 'erase_list', 'delete_list',
+	'plot_area', 'erase_area', 'delete_area',
+	'draw', 'blit', 'erase_sprite',
+	'plot_line', 'erase_line', 'delete_line', 'connect_dots',
+	'draw_axis', 'draw_axes', 'graph', 'draw_under', 'erase_under',
+])
+
+# Draws a Window on its own threads, from commands queued by any thread
+class RenderThread(object):
+	"""
+	Double-buffered drawing from several threads.
+
+	Producers queue drawing commands from any thread, either with submit()
+	or by calling the Window's drawing methods on the RenderThread itself:
+
+		renderer = RenderThread(window, fps=30)
+		renderer.plot_point((10,5), '*', 'red')		# from any thread
+		renderer.submit(lambda w: w.erase())		# any callable(window)
+
+	Queueing a command never blocks.  The render thread applies the commands
+	to the stage (the back buffer), and fps times per second swaps it out:
+	it takes a copy-on-write snapshot of what changed (the front buffer)
+	and hands it to the output thread, which sends it to the terminal.  A
+	slow terminal only makes frames drop (the waiting frame is replaced by
+	a newer one); it never holds up drawing or the producers.
+
+	Only the drawing methods in RENDER_COMMANDS can be called on the
+	RenderThread; queue anything else (or a query, whose result is lost)
+	with submit().  While the threads run, only they may touch the window.
+	The delay= of the drawing methods is ignored: frames come at the
+	renderer's fps.
+
+	Pending resizes, the frame start hooks and _take_frame() run on the
+	render thread, before each swap.  The recorder, the frame stats and the
+	frame end hooks run on the output thread, as each frame is sent.
+
+		self.frames  -- frames swapped out to the output thread
+		self.shown   -- frames sent to the terminal
+		self.dropped -- frames replaced before they could be sent
+		self.errors  -- (command, exception) for the commands that failed
+
+	"""
+	def __init__(self, window, fps=30):
+		self.window = window
+		self.fps = fps
+		self.interval = 1.0 / fps
+		self.commands = queue.Queue()
+
+		self.frames = 0
+		self.shown = 0
+		self.dropped = 0
+		self.errors = []
+
+		self._front = None		# (frame, rows, start) waiting for the output thread
+		self._swapped = threading.Condition()
+		self._stopping = False
+		self._finished = False	# no more frames will be swapped
+
+		window.render_thread = self
+		self._render = threading.Thread(target=self._render_loop)
+		self._output = threading.Thread(target=self._output_loop)
+		for thread in [self._render, self._output]:
+			thread.daemon = True
+			thread.start()
+
+	# queue a Window drawing method by calling it on the RenderThread
+	def __getattr__(self, name):
+		if name not in RENDER_COMMANDS:
+			raise AttributeError('%r is not a drawing method of Window (use '
+								 'submit() for anything else)' % (name,))
+		def command(*args, **kwargs):
+			self.submit(name, *args, **kwargs)
+		return command
+
+	# queue a drawing command
+	def submit(self, command, *args, **kwargs):
+		"""Queues a command for the render thread.
+
+		command is the name of a Window method (called with *args, **kwargs)
+		or a callable, which is called with the window as its first argument.
+		"""
+		self.commands.put((command, args, kwargs))
+
+	# apply one command to the back buffer
+	def _apply(self, item):
+		"""Runs one queued command on the window."""
+		command, args, kwargs = item
+		try:
+			if callable(command):
+				command(self.window, *args, **kwargs)
+			else:
+				getattr(self.window, command)(*args, **kwargs)
+		except Exception as error:
+			self.errors.append((command, error))
+
+	# render thread: apply commands, and swap buffers once per frame
+	def _render_loop(self):
+		"""Applies queued commands until stop(), swapping every interval."""
+		next_frame = time()
+		while True:
+			try:
+				item = self.commands.get(timeout=max(0, next_frame - time()))
+			except queue.Empty:
+				item = None
+
+			if item is not None:
+				self._apply(item)
+				# apply whatever else is waiting before looking at the clock
+				while True:
+					try:
+						item = self.commands.get_nowait()
+					except queue.Empty:
+						break
+					self._apply(item)
+
+			now = time()
+			if now >= next_frame:
+				self._swap()
+				next_frame = max(next_frame + self.interval, now)
+			if self._stopping and self.commands.empty():
+				self._swap()
+				break
+
+		with self._swapped:
+			self._finished = True
+			self._swapped.notify()
+
+	# hand the back buffer's changes to the output thread
+	def _swap(self):
+		"""Snapshots the changed frame for the output thread."""
+		window = self.window
+		if window._resize_pending:
+			window.resize()
+		start = None
+		if window._instrumented():
+			for handler in list(window._frame_start_hooks):
+				handler(window)
+			start = time()
+		if not window.is_dirty():
+			return
+		frame, rows = window._take_frame()
+		if frame is window.stage:
+			frame = window._snapshot()
+		else:
+			frame = window._copy_grid(frame)
+
+		with self._swapped:
+			if self._front is not None:
+				# the terminal has not taken the last frame: replace it
+				old_rows = self._front[1]
+				if rows is not None and old_rows is not None:
+					rows = sorted(set(rows) | set(old_rows))
+				else:
+					rows = None
+				self.dropped += 1
+			self._front = (frame, rows, start)
+			self.frames += 1
+			self._swapped.notify()
+
+	# output thread: send swapped frames to the terminal
+	def _output_loop(self):
+		"""Displays each front buffer as it is swapped in."""
+		while True:
+			with self._swapped:
+				while self._front is None and not self._finished:
+					self._swapped.wait()
+				if self._front is None:
+					break
+				frame, rows, start = self._front
+				self._front = None
+			if start is None:
+				self.window._present(frame, rows)
+			else:
+				self.window._present_instrumented(frame, rows, start)
+			self.shown += 1
+
+	# stop the threads
+	def stop(self):
+		"""Applies the commands already queued, displays the last frame and
+		stops both threads."""
+		self._stopping = True
+		self._render.join()
+		self._output.join()
+		self.window.render_thread = None
+
+	# get the frame statistics
+	def stats(self):
+		"""Returns the frame statistics as a dict."""
+		return {'fps': self.fps, 'frames': self.frames, 'shown': self.shown,
+				'dropped': self.dropped, 'errors': len(self.errors)}
+
+
+# Per-frame counters and method timings of a Window
+class FrameStats(object):
+	"""
+	Instrumentation of a Window, made by Window.enable_stats().
+
+	Every display() adds a record to self.frames:
+
+		'start', 'seconds' -- when the frame started (seconds since the
+							  stats were enabled) and how long display() took
+		'rows'             -- rows compared
+		'cells_written'    -- cells sent to the terminal
+		'cells_changed'    -- cells that differ from the previous frame
+		'bytes'            -- characters sent to the terminal
+		'flush_seconds'    -- time spent writing them to the stream
+
+	With methods=True every public Window and Thing method (and termcolor's
+	colored(), which does the styling) is timed as well: self.methods holds
+	{name: [calls, seconds]}, where the seconds include the methods called
+	from inside it.  display() and the loops that call everything else
+	(run(), start()) are left out.  Nothing is wrapped or timed while the
+	stats are disabled.
+
+	Export the records with to_json() or chrome_trace() (for chrome://tracing
+	or Perfetto), or save(path).
+
+	"""
+	def __init__(self, window, methods=True, max_events=100000):
+		self.window = window
+		self.start = time()
+		self.frames = []
+		self.methods = {}
+		self.max_events = max_events
+		self.events = []		# (name, start, end) of the timed calls
+		self.timing = methods
+
+		self._last = None		# (size, grid) of the previous frame
+		self._wrapped = []		# Window methods wrapped on the window
+
+	# record one call of a timed method
+	def _record(self, name, start, end):
+		"""Adds the time of one call to the totals (and the timeline)."""
+		totals = self.methods.get(name)
+		if totals is None:
+			totals = self.methods[name] = [0, 0.0]
+		totals[0] += 1
+		totals[1] += end - start
+		if len(self.events) < self.max_events:
+			self.events.append((name, start, end))
+
+	# count the cells of a frame that changed since the last one
+	def _changed(self, frame, rows):
+		"""Returns the number of cells in rows of frame that differ from the
+		previous frame, and keeps a copy of this one."""
+		window = self.window
+		if rows is None:
+			rows = range(window.height+1)
+		changed = 0
+		size = (window.width, window.height)
+		if self._last is None or self._last[0] != size:
+			changed = (window.width+1) * len(rows)
+		else:
+			last = self._last[1]
+			for y in rows:
+				old = window._row_cells(last, y)
+				new = window._row_cells(frame, y)
+				changed += sum([1 for (a, b) in zip(old, new) if a != b])
+		self._last = (size, window._copy_grid(frame))
+		return changed
+
+	# get the totals
+	def summary(self):
+		"""Returns the totals of all frames as a dict."""
+		frames = self.frames
+		total = lambda key: sum([frame[key] for frame in frames])
+		return {
+			'frames': len(frames),
+			'seconds': total('seconds'),
+			'cells_written': total('cells_written'),
+			'cells_changed': total('cells_changed'),
+			'bytes': total('bytes'),
+			'flush_seconds': total('flush_seconds'),
+			'methods': dict([(name, {'calls': calls, 'seconds': seconds})
+							 for (name, (calls, seconds)) in self.methods.items()]),
+		}
+
+	# get everything as JSON-ready data
+	def to_json(self):
+		"""Returns the summary, the frame records and the timed calls as a
+		JSON-ready dict."""
+		return {
+			'summary': self.summary(),
+			'frames': self.frames,
+			'calls': [{'name': name, 'start': start - self.start,
+					   'seconds': end - start}
+					  for (name, start, end) in self.events],
+		}
+
+	# get everything as a Chrome trace
+	def chrome_trace(self):
+		"""Returns the frames and timed calls in the Chrome trace event
+		format (a dict with 'traceEvents')."""
+		us = lambda seconds: int(seconds * 1e6)
+		events = []
+		for frame in self.frames:
+			counters = dict([(key, frame[key]) for key in
+							 ['rows', 'cells_written', 'cells_changed', 'bytes']])
+			events.append({'name': 'display', 'ph': 'X', 'pid': 1, 'tid': 1,
+						   'ts': us(frame['start']), 'dur': us(frame['seconds']),
+						   'args': counters})
+			events.append({'name': 'frame', 'ph': 'C', 'pid': 1,
+						   'ts': us(frame['start']), 'args': counters})
+		for (name, start, end) in self.events:
+			events.append({'name': name, 'ph': 'X', 'pid': 1, 'tid': 1,
+						   'ts': us(start - self.start), 'dur': us(end - start)})
+		events.sort(key=lambda event: event['ts'])
+		return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+	# write the stats to a file
+	def save(self, path, format='json'):
+		"""Saves to_json() (format='json') or chrome_trace()
+		(format='chrome') to a file."""
+		data = self.chrome_trace() if format == 'chrome' else self.to_json()
+		with open(path, 'w') as f:
+			json.dump(data, f)
+
+
+# Window methods that are not timed: the stats' own methods, display()
+# (each frame already has a record), and the loops that call everything else
+_UNTIMED_WINDOW_METHODS = ['enable_stats', 'disable_stats', 'on_frame_start',
+						   'on_frame_end', 'display', 'start', 'run']
+
+# the original methods while some stats time them (see _time_methods())
+_untimed = {}
+_timing_stats = []
+
+# wrap a bound method so that its calls are timed
+def _timed_method(stats, name, method):
+	def timed(*args, **kwargs):
+		start = time()
+		try:
+			return method(*args, **kwargs)
+		finally:
+			stats._record(name, start, time())
+	timed.__doc__ = method.__doc__
+	return timed
+
+# wrap a Thing method so that its calls are timed by its window's stats
+def _timed_thing_method(name, function):
+	def timed(self, *args, **kwargs):
+		stats = self.window.stats
+		if stats is None or not stats.timing:
+			return function(self, *args, **kwargs)
+		start = time()
+		try:
+			return function(self, *args, **kwargs)
+		finally:
+			stats._record(name, start, time())
+	timed.__doc__ = function.__doc__
+	return timed
+
+# wrap colored() so that the styling time is recorded
+def _timed_colored(*args, **kwargs):
+	start = time()
+	try:
+		return _untimed['colored'](*args, **kwargs)
+	finally:
+		end = time()
+		for stats in _timing_stats:
+			stats._record('colored', start, end)
+
+# start or stop timing the Thing methods and colored()
+def _time_methods(stats, on):
+	"""Adds (on=True) or removes stats from the stats that time the module
+	level functions and Thing methods; they are only wrapped while there
+	are any."""
+	global colored
+	if on:
+		_timing_stats.append(stats)
+		if len(_timing_stats) > 1:
+			return
+		_untimed['colored'] = colored
+		colored = _timed_colored
+		for name in _public_methods(Thing):
+			function = Thing.__dict__[name]
+			_untimed['Thing.' + name] = function
+			setattr(Thing, name, _timed_thing_method('Thing.' + name, function))
+	else:
+		if stats in _timing_stats:
+			_timing_stats.remove(stats)
+		if _timing_stats or not _untimed:
+			return
+		colored = _untimed.pop('colored')
+		for name in _public_methods(Thing):
+			setattr(Thing, name, _untimed.pop('Thing.' + name))
+
+# get the names of the public methods of a class
+def _public_methods(cls):
+	return [name for (name, value) in cls.__dict__.items()
+			if not name.startswith('_') and callable(value)]
+
+
+#------------------------------- RECORDING -----------------------------------
+
+# version of the recording file format
+RECORDING_VERSION = 1
+
+# open a recording (gzip-compressed if the name ends in .gz)
+def _open_recording(path, mode):
+	if path.endswith('.gz'):
+		import gzip
+		return gzip.open(path, mode)
+	return open(path, mode)
+
+# Writes the displayed frames of a Window to a file
+class Recorder(object):
+	"""
+	Records every frame a Window displays, made by Window.record().
+
+	Each frame is written to the file as it is displayed, so only the last
+	frame is kept in memory, however long the recording.  The file has one
+	JSON object per line (gzip-compressed if the path ends in .gz):
+
+		{"keyframe_every":300,"version":1}
+		{"k":0.0,"rows":[[i,n,...],...],"size":[w,h],"strings":[...]}
+		{"d":0.0167,"runs":[[row,column,i,...],...],"strings":[...]}
+
+	The first line is the header.  A keyframe ("k") has every cell, a row
+	at a time from the top, as (index, count) pairs for the runs of the
+	same cell.  The indexes are into a table of the printed cell strings,
+	which starts over at each keyframe.  A delta ("d") has the runs of
+	cells that changed since the previous frame, and the strings it adds
+	to the table.  Times are seconds since the recording started.
+
+	There is a keyframe every keyframe_every frames (and after a resize),
+	so a Replayer can seek without going through the whole file.  Frames
+	that change nothing are not written.
+
+	"""
+	def __init__(self, window, path, keyframe_every=300):
+		self.window = window
+		self.path = path
+		self.keyframe_every = keyframe_every
+		self.frames = 0
+		self.start = time()
+
+		self._file = _open_recording(path, 'wb')
+		self._rows = None		# the last frame, as rows (top first) of strings
+		self._strings = {}		# string -> index, since the last keyframe
+		self._deltas = 0		# deltas since the last keyframe
+		self._write({'version': RECORDING_VERSION,
+					 'keyframe_every': keyframe_every})
+
+	# write one line
+	def _write(self, record):
+		line = json.dumps(record, separators=(',', ':'), sort_keys=True)
+		self._file.write((line + '\n').encode('ascii'))
+
+	# get the index of a string in the table, adding it if it is new
+	def _index(self, text, new):
+		try:
+			return self._strings[text]
+		except KeyError:
+			index = self._strings[text] = len(self._strings)
+			new.append(text)
+			return index
+
+	# record a frame
+	def _frame(self, frame, rows):
+		"""Writes a frame from Window._take_frame() (rows are the rows that
+		may have changed, None for all)."""
+		window = self.window
+		text = cell_text if window.compact else _same
+		height = window.height
+		now = round(time() - self.start, 4)
+		new = []
+
+		if self._rows is None or len(self._rows) != height+1 or \
+		   len(self._rows[0]) != window.width+1 or \
+		   self._deltas >= self.keyframe_every:
+			self._strings = {}
+			self._rows = [[text(cell) for cell in window._row_cells(frame, height - r)]
+						  for r in range(height+1)]
+			encoded = []
+			for row in self._rows:
+				line = []
+				for (cell, same) in groupby(row):
+					line.append(self._index(cell, new))
+					line.append(len(list(same)))
+				encoded.append(line)
+			self._write({'k': now, 'size': [window.width, height],
+						 'strings': new, 'rows': encoded})
+			self._file.flush()
+			self._deltas = 0
+		else:
+			if rows is None:
+				rows = range(height+1)
+			runs = []
+			for y in rows:
+				r = height - y
+				cells = [text(cell) for cell in window._row_cells(frame, y)]
+				old = self._rows[r]
+				end = None
+				for x in compress(count(), map(ne, cells, old)):
+					if x != end:
+						run = [r, x]
+						runs.append(run)
+					run.append(self._index(cells[x], new))
+					end = x + 1
+				self._rows[r] = cells
+			if not runs:
+				return
+			self._write({'d': now, 'strings': new, 'runs': runs})
+			self._deltas += 1
+		self.frames += 1
+
+	# finish the file
+	def close(self):
+		"""Stops recording and closes the file."""
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+
+# Plays a recording back
+class Replayer(object):
+	"""
+	Plays a recording made by Window.record() back in a Window.
+
+		replayer = Replayer('session.rec.gz')
+		replayer.play()						# in real time
+		replayer.play(speed=4)				# 4x as fast
+		replayer.play(speed=None)			# as fast as it goes
+		replayer.seek(90)					# show the frame at 1:30
+		replayer.play(start=90, end=120)
+
+	window is the Window to show it in (default: a new Window of the
+	recorded size, made on the first frame).  Use string storage for it
+	-- compact storage has room for a limited number of printed strings.
+
+	Opening a recording reads through it once, to find the keyframes (in
+	self.keyframes, as (time, offset)), the number of frames and the
+	duration.  Only the current frame is kept in memory.
+
+	"""
+	def __init__(self, path, window=None):
+		self.path = path
+		self.window = window
+		self.time = None		# time of the frame shown
+
+		self._file = _open_recording(path, 'rb')
+		line = self._file.readline()
+		try:
+			header = json.loads(line.decode('ascii'))
+		except ValueError:
+			header = {}
+		if not isinstance(header, dict) or \
+		   header.get('version') != RECORDING_VERSION:
+			raise ValueError('%s is not a termwindow recording' % path)
+		self.keyframe_every = header.get('keyframe_every')
+
+		# find the keyframes (the time is the first key on every line)
+		self.keyframes = []
+		self.frames = 0
+		self.duration = 0.0
+		while True:
+			offset = self._file.tell()
+			line = self._file.readline().decode('ascii')
+			if not line.strip():
+				break
+			self.duration = float(line[5:line.index(',')])
+			if line.startswith('{"k"'):
+				self.keyframes.append((self.duration, offset))
+			self.frames += 1
+		if not self.keyframes:
+			raise ValueError('%s has no frames' % path)
+
+		self._strings = []
+		self._next = None		# the record after the frame shown
+
+	# read the next record
+	def _read(self):
+		if self._next is not None:
+			(record, self._next) = (self._next, None)
+			return record
+		line = self._file.readline()
+		if not line.strip():
+			return None
+		return json.loads(line.decode('ascii'))
+
+	# put a printed string into a cell of the window
+	def _put(self, r, x, text):
+		window = self.window
+		if window.compact:
+			text = compact_cell(text)
+		window.stage[x][window.height - r] = text
+
+	# show the cells of a record on the stage
+	def _apply(self, record):
+		"""Updates the window's stage with a keyframe or a delta."""
+		window = self.window
+		if 'k' in record:
+			(width, height) = record['size']
+			if window is None:
+				window = self.window = Window(diff=True, size=[width, height])
+			elif (width, height) != (window.width, window.height):
+				window.resize([width, height])
+			window._own()
+			strings = self._strings = record['strings']
+			for (r, line) in enumerate(record['rows']):
+				x = 0
+				for k in range(0, len(line), 2):
+					text = strings[line[k]]
+					for n in range(line[k+1]):
+						self._put(r, x, text)
+						x += 1
+			window.touch_all()
+			self.time = record['k']
+		else:
+			window._own()
+			strings = self._strings
+			strings.extend(record['strings'])
+			for run in record['runs']:
+				(r, x) = run[:2]
+				for index in run[2:]:
+					self._put(r, x, strings[index])
+					x += 1
+				window._touch(window.height - r)
+			self.time = record['d']
+
+	# go to a point in time
+	def seek(self, seconds):
+		"""Shows the last frame at or before seconds into the recording
+		(starting from the keyframe before it)."""
+		times = [keyframe[0] for keyframe in self.keyframes]
+		k = max(bisect_right(times, seconds) - 1, 0)
+		self._file.seek(self.keyframes[k][1])
+		self._next = None
+		self._apply(self._read())
+		while True:
+			record = self._read()
+			if record is None:
+				break
+			if record.get('k', record.get('d')) > seconds:
+				self._next = record
+				break
+			self._apply(record)
+		self.window.display()
+
+	# play the recording
+	def play(self, speed=1.0, start=None, end=None):
+		"""Shows the frames from start (default: where the last play() or
+		seek() stopped, or the beginning) to end (default: the end), speed
+		times as fast as they were recorded (as fast as possible if speed
+		is None)."""
+		if start is not None or self.time is None:
+			self.seek(start or 0.0)
+		began = time()
+		origin = self.time
+		while True:
+			record = self._read()
+			if record is None:
+				break
+			at = record.get('k', record.get('d'))
+			if end is not None and at > end:
+				self._next = record
+				break
+			if speed:
+				delay = (at - origin) / float(speed) - (time() - began)
+				if delay > 0:
+					sleep(delay)
+			self._apply(record)
+			self.window.display()
+
+	# let go of the file
+	def close(self):
+		"""Closes the recording."""
+		self._file.close()
 
 
 # Display of the window
 class Window(object):
 	"""
 	An object with a size equal to the size of the terminal window upon
-	instantiation.  The Window has a colored border that can be customized.
+	instantiation (or any size= given).  The Window has a colored border
+	that can be customized.
 	
 	Points can be plotted using (x,y) coordinate tuples, where:
 		(0,0) -- lower left corner of the border
@@ -38,7 +1584,9 @@ class Window(object):
 
 	"""
 
-	def __init__(self, border_color=None, top='=', bottom='=', left='|', right='|'):
+	def __init__(self, border_color=None, top='=', bottom='=', left='|', right='|',
+				 diff=False, terminal=None, alt_screen=False, storage='strings',
+				 fps=60, size=None, headless=False):
 		"""
 		Initialize Window
 		
@@ -52,10 +1600,52 @@ class Window(object):
 							   This list must be set once you have your
 							   background drawn on self.stage using
 							   self.set_background()
+
+		If diff=True, display() keeps a copy of what the terminal currently
+		shows and only sends the cells that changed since the last frame.
+
+		All output goes through self.terminal (a Terminal object).  Pass your
+		own as terminal=, or alt_screen=True to draw on the alternate screen.
+
+		Animated drawing (the delay= arguments) is paced by self.scheduler,
+		a FrameScheduler that displays at most fps frames per second.  With
+		fps=None every animated change is displayed after sleeping its delay.
+
+		storage can be 'strings', 'compact' or 'numpy'
+			storage='strings'	--  Each cell holds its colored string [DEFAULT]
+			storage='compact'	--  Each column is an array of integer cells
+									(style id + character, see compact_cell()),
+									about a tenth of the memory.  Colors are
+									only applied when the cell is printed.
+			storage='numpy'		--  Like 'compact', but the stage is a 2-D
+									NumPy array, so areas are filled with a
+									single slice assignment.
+
+		The window fills the terminal (see terminal_size()), unless a size
+		[width, height] is given (the upper right corner of the border).
+		With headless=True the terminal is never touched: the size is size
+		or DEFAULT_SIZE, and the output is thrown away unless a terminal=
+		is given (e.g. Terminal(open('frames.txt', 'w'))).
 		
 		"""
-		self.width = WIDTH - 1
-		self.height = HEIGHT - 2
+		# where the output goes
+		if terminal is None:
+			if headless:
+				terminal = Terminal(_NullStream(), terminfo=False)
+			else:
+				terminal = Terminal(alt_screen=alt_screen)
+		self.terminal = terminal
+		self.headless = headless
+
+		# size of the window
+		if size is None:
+			if headless:
+				(columns, lines) = DEFAULT_SIZE
+			else:
+				(columns, lines) = terminal_size(terminal.stream)
+			size = [columns - 1, lines - 3]
+		self.width = int(size[0])
+		self.height = int(size[1])
 
 		# Convenience constants
 		self.mx = self.width
@@ -74,35 +1664,66 @@ class Window(object):
 		self.blank = []
 		self.background = []
 
-		# clear screen
-		os.system('clear')
-
-		# Hide the cursor
-		self.hide_cursor()
+		# how cells are stored
+		if storage not in ['strings', 'compact', 'numpy']:
+			raise ValueError("storage must be 'strings', 'compact' or 'numpy'")
+		if storage == 'numpy' and numpy is None:
+			raise ImportError("storage='numpy' needs NumPy")
+		self.storage = storage
+		self.compact = (storage in ['compact', 'numpy'])
+		self._numpy = (storage == 'numpy')
+
+		# pacing of animated drawing
+		self.scheduler = None if fps is None else FrameScheduler(self, fps)
+
+		# handlers for run() / start()
+		self._tick_handlers = []
+		self._input_handlers = []
+		self.render_loop = None
+		self.render_thread = None	# see RenderThread
+
+		# damage tracking for the differential display
+		self.diff = diff
+		self._shown = None			# what the terminal shows (None = unknown)
+		self._dirty_rows = set()	# rows touched since the last display
+		self._all_dirty = True		# compare every row on the next display
+		self._generation = 0		# stage writes not made by Things (see Thing.move())
+		self._resize_pending = False	# see watch_resize()
+		self._scrolls = []			# see _shift_left()
+
+		# instrumentation (see enable_stats() and record())
+		self.stats = None
+		self.recorder = None
+		self._frame_start_hooks = []
+		self._frame_end_hooks = []
+
+		# clear screen and hide the cursor
+		self.terminal.start()
 
 		# create blank window stage
-		for x in range(self.width+1):
-			self.stage.append([" "] * (self.height+1))
+		self.stage = self._grid(self._plain(" "))
+		if not self._numpy:
+			self.stage = SharedGrid(self.stage, shared=False)
 
 		#draw window border
-		for y in range(self.height+1):
-			for x in range(self.width+1):
-				#top
-				pos = x % len(top)
-				self.stage[x][self.height] = colored( top[pos], border_color )
-				#bottom
-				pos = x % len(bottom)
-				self.stage[x][0] = colored( bottom[pos], border_color )
-				#left 
-				pos = y % len(left)
-				self.stage[0][y] = colored( left[pos], border_color )
-				#right
-				pos = y % len(right)
-				self.stage[self.width][y] = colored( right[pos], border_color )
+		self._border = (border_color, top, bottom, left, right)
+		self._draw_border(self.stage, self.width, self.height,
+						  range(self.width+1))
 	
 		# make a copy of the blank, bordered background
-		self.blank = deepcopy(self.stage)
-		self.background = deepcopy(self.stage)
+		self.blank = self._snapshot()
+		self.background = self._snapshot()
+		self._own()
+
+		# named snapshots (see save_snapshot())
+		self.snapshots = {}
+
+		# the Things drawn in the window, by position (see SpatialHash)
+		self.things = SpatialHash()
+
+		# layers drawn over the stage (see add_layer()), lowest z first
+		self.layers = []
+		self._frame = None			# the stage with the layers composited
 
 
 	#--------------------------- WINDOW BASICS ---------------------------------
@@ -110,48 +1731,795 @@ class Window(object):
 	# set stage as background
 	def erase(self):
 		"""Return entire stage to background."""
-		self.stage = deepcopy(self.background)
+		self._restore(self.background)
 	
 	# set stage as blank
 	def delete(self):
 		"""Make entire stage blank."""
-		self.stage = deepcopy(self.blank)
+		self._restore(self.blank)
+
+	# take a snapshot of the stage
+	def _snapshot(self):
+		"""Returns a snapshot of the stage that is never written to.
+
+		The snapshot shares its cells with the stage: a column (or, with
+		NumPy storage, the whole array) is only copied once the stage is
+		written to again.
+		"""
+		if self._numpy:
+			self.stage.flags.writeable = False
+			return self.stage
+		if not isinstance(self.stage, SharedGrid):
+			self.stage = SharedGrid(self.stage)
+		return self.stage.snapshot()
+
+	# make the stage a (copy-on-write) copy of a snapshot
+	def _restore(self, snapshot):
+		"""Sets the stage to a snapshot, without copying any cells."""
+		if self._numpy:
+			snapshot.flags.writeable = False
+			self.stage = snapshot
+		else:
+			self.stage = SharedGrid(snapshot)
+		self._all_dirty = True
+		self._generation += 1
+
+	# make sure a NumPy stage does not share its memory with a snapshot
+	def _own(self):
+		"""Copies a NumPy stage that is still shared with a snapshot, before
+		writing to it.  (List-based stages copy each column by themselves.)"""
+		if self._numpy and not self.stage.flags.writeable:
+			self.stage = self.stage.copy()
+
+	# save the stage under a name
+	def save_snapshot(self, name):
+		"""Saves what is on the stage as a named snapshot.
+
+		Saving is cheap: the snapshot shares its cells with the stage until
+		they are drawn over.  Switch scenes with restore_snapshot(name), or
+		make a snapshot the background with set_background(name).
+		"""
+		self.snapshots[name] = self._snapshot()
+
+	# put a named snapshot back on the stage
+	def restore_snapshot(self, name):
+		"""Sets the stage to a named snapshot (see save_snapshot())."""
+		self._restore(self.snapshots[name])
+
+	# forget a named snapshot
+	def delete_snapshot(self, name):
+		"""Deletes a named snapshot (see save_snapshot())."""
+		del self.snapshots[name]
 
 	# make cursor invisible
 	def hide_cursor(self):
 		"""Sets cursor to invisible."""
-		os.system('echo "\x1b[?25l"')
-		return
+		self.terminal.hide_cursor()
 
 	# make cursor visible again
 	def show_cursor(self):
 		"""Sets cursor back to visible."""
-		os.system('echo "\x1b[?25h"')
-		return
+		self.terminal.show_cursor()
 
 	# show cursor and exit gracefully
 	def exit(self):
-		"""Sets cursor visible and exits."""
-		self.show_cursor()
+		"""Sets cursor visible, leaves the alternate screen and exits."""
+		self.stop_recording()
+		self.terminal.stop()
 		exit()
 
 	# set background so self.erase() will just erase the foreground
-	def set_background(self):
-		"""Sets the background as what is currently shown on self.stage"""
-		self.background = deepcopy(self.stage)
+	def set_background(self, name=None):
+		"""Sets the background as what is currently shown on self.stage
+
+		If name is given, the named snapshot (see save_snapshot()) becomes
+		the background instead.
+		"""
+		if name is None:
+			self.background = self._snapshot()
+		else:
+			self.background = self.snapshots[name]
 		return
 
+	# make the value stored in a cell of self.stage
+	def _cell(self, character, color=None, on_color=None, attrs=None):
+		"""Returns the stage value of a character with the given colors.
+
+		With string storage this is the colored string, with compact storage
+		it is an integer cell (see compact_cell()).
+		"""
+		try:
+			style = Style(color, on_color, attrs)
+		except:
+			style = Style()
+		return self._styled(character, style)
+
+	# make the value stored in a cell of self.stage, for a resolved Style
+	def _styled(self, character, style):
+		"""Returns the stage value of a character in a Style."""
+		if self.compact:
+			return style.cell(character)
+		return style.paint(character)
+
+	# make the value stored in a cell of self.stage for a plain character
+	def _plain(self, character):
+		"""Returns the stage value of an uncolored character (like the
+		blank spaces of a new stage)."""
+		if self.compact:
+			return compact_cell(character)
+		return character
+
+	# make a stage-sized grid, filled with a cell value
+	def _grid(self, cell):
+		"""Returns a new grid of (self.width+1) columns of (self.height+1)
+		copies of cell."""
+		if self._numpy:
+			return numpy.full((self.width+1, self.height+1), cell, dtype=numpy.uint32)
+		if self.compact:
+			return [array('I', [cell]) * (self.height+1) for x in range(self.width+1)]
+		return [[cell] * (self.height+1) for x in range(self.width+1)]
+
+	# copy a stage-sized grid
+	def _copy_grid(self, grid):
+		"""Returns a copy of a grid (like self.stage) that shares nothing
+		with it."""
+		if self._numpy:
+			return grid.copy()
+		return [column[:] for column in grid]
+
+	# move a rectangle of a grid to the left
+	def _shift_grid(self, grid, x1, x2, y1, y2, n=1):
+		"""Moves the cells of a grid in columns x1+n..x2, rows y1..y2, n
+		columns to the left.  The last n columns keep their cells."""
+		if self._numpy:
+			grid[x1:x2+1-n, y1:y2+1] = grid[x1+n:x2+1, y1:y2+1].copy()
+		else:
+			for x in range(x1, x2+1-n):
+				grid[x][y1:y2+1] = self._column(grid, x+n)[y1:y2+1]
+
+	# move a rectangle of the stage to the left
+	def _shift_left(self, x1, x2, y1, y2, n=1, scroll=False):
+		"""Moves the cells of the stage in columns x1+n..x2, rows y1..y2, n
+		columns to the left (the last n columns keep their cells, to be
+		drawn over).
+
+		With scroll=True the next differential display moves them on the
+		terminal as well (see Terminal.scroll_left()), so only the cells
+		that really changed are printed again.
+		"""
+		self._own()
+		self._shift_grid(self.stage, x1, x2, y1, y2, n)
+		self._touch_rows(y1, y2)
+		if scroll and self.diff and self._shown is not None and \
+		   self.render_thread is None:
+			self._scrolls.append((x1, x2, y1, y2, n))
+
+	# get the cells of one row of a grid
+	def _row_cells(self, grid, y):
+		"""Returns row y of a grid (like self.stage) as a list of cells."""
+		if self._numpy:
+			return grid[:, y].tolist()
+		return [column[y] for column in grid]
+
+	# get the string to print for one row of a grid
+	def _row_text(self, grid, y, rep=False):
+		"""Returns row y of a grid (like self.stage) as a printable string
+		(see _encode_cells())."""
+		cells = self._row_cells(grid, y)
+		if self.compact:
+			return _encode_cells([cell_text(cell) for cell in cells], rep)
+		return _encode_cells(cells, rep)
+
 	# print the window in terminal
 	def display(self):
-		"""Refreshes the image of the stage."""
+		"""Refreshes the image of the stage.
+
+		In differential mode (diff=True) only the cells that changed since the
+		last display are sent to the terminal.
+		"""
+		if self._resize_pending:
+			self.resize()
+		if self._instrumented():
+			for handler in list(self._frame_start_hooks):
+				handler(self)
+			start = time()
+			frame, rows = self._take_frame()
+			self._present_instrumented(frame, rows, start)
+			return
+		frame, rows = self._take_frame()
+		self._present(frame, rows)
+
+	# see whether frames go through _present_instrumented()
+	def _instrumented(self):
+		"""Returns True if there are frame hooks, stats or a recorder."""
+		return self.stats is not None or self.recorder is not None or \
+			   bool(self._frame_start_hooks or self._frame_end_hooks)
+
+	# present a frame, with the recorder, the frame stats and the end hooks
+	def _present_instrumented(self, frame, rows, start):
+		"""_present() for when there are frame hooks, stats or a recorder;
+		start is when the frame was started."""
+		stats = self.stats
+		terminal = self.terminal
+		bytes_written = terminal.bytes_written
+		flush_seconds = terminal.flush_seconds
+
+		if self.recorder is not None:
+			self.recorder._frame(frame, rows)
+		if stats is not None:
+			changed = stats._changed(frame, rows)
+		written = self._present(frame, rows)
+
+		record = None
+		if stats is not None:
+			record = {
+				'start': start - stats.start,
+				'seconds': time() - start,
+				'rows': self.height+1 if rows is None else len(rows),
+				'cells_written': written,
+				'cells_changed': changed,
+				'bytes': terminal.bytes_written - bytes_written,
+				'flush_seconds': terminal.flush_seconds - flush_seconds,
+			}
+			stats.frames.append(record)
+
+		for handler in list(self._frame_end_hooks):
+			handler(self, record)
+
+	# call a handler before every display
+	def on_frame_start(self, handler):
+		"""Adds a handler that display() calls with the window before it
+		builds a frame."""
+		self._frame_start_hooks.append(handler)
+		return handler
+
+	# call a handler after every display
+	def on_frame_end(self, handler):
+		"""Adds a handler that display() calls with the window and the
+		frame's record (see enable_stats(); None without stats) after the
+		frame is sent."""
+		self._frame_end_hooks.append(handler)
+		return handler
+
+	# start recording the frames
+	def record(self, path, keyframe_every=300):
+		"""Starts writing every displayed frame to a file (see Recorder and
+		Replayer), and returns the Recorder."""
+		self.stop_recording()
+		self.recorder = Recorder(self, path, keyframe_every)
+		return self.recorder
+
+	# stop recording the frames
+	def stop_recording(self):
+		"""Stops recording and closes the file, and returns the Recorder
+		(None if there was none)."""
+		recorder = self.recorder
+		if recorder is not None:
+			recorder.close()
+			self.recorder = None
+		return recorder
+
+	# start collecting frame stats
+	def enable_stats(self, methods=True, max_events=100000):
+		"""Starts recording per-frame counters in self.stats (a FrameStats),
+		and returns it.
+
+		With methods=True the calls of the public Window and Thing methods
+		are timed too (keeping up to max_events of them for the timeline).
+		"""
+		if self.stats is not None:
+			self.disable_stats()
+		stats = FrameStats(self, methods, max_events)
+		self.stats = stats
+		if methods:
+			for name in _public_methods(Window):
+				if name in _UNTIMED_WINDOW_METHODS:
+					continue
+				setattr(self, name,
+						_timed_method(stats, 'Window.' + name, getattr(self, name)))
+				stats._wrapped.append(name)
+			_time_methods(stats, True)
+		return stats
+
+	# stop collecting frame stats
+	def disable_stats(self):
+		"""Stops recording stats (and timing methods), and returns the
+		FrameStats."""
+		stats = self.stats
+		if stats is None:
+			return None
+		for name in stats._wrapped:
+			delattr(self, name)
+		del stats._wrapped[:]
+		_time_methods(stats, False)
+		self.stats = None
+		return stats
+
+	# get the frame to display, and mark the window as displayed
+	def _take_frame(self):
+		"""Returns (frame, rows): the grid to display, and the rows that
+		changed since the last display (None if every row may have)."""
+		frame = self._composite()
+		if self._all_dirty:
+			rows = None
+		else:
+			rows = sorted(self._dirty_rows)
+		self._dirty_rows.clear()
+		self._all_dirty = False
+		return frame, rows
+
+	# send a frame to the terminal
+	def _present(self, frame, rows=None):
+		"""Prints a frame from _take_frame(), differentially if possible.
+		Returns the number of cells printed."""
+		if self.diff and self._shown is not None:
+			return self._display_diff(frame, rows)
+		else:
+			return self._display_full(frame)
+
+	# reprint every cell of the stage
+	def _display_full(self, frame):
+		"""Reprints the whole frame, starting at the top left corner."""
+		del self._scrolls[:]
+		terminal = self.terminal
+		terminal.begin_frame()
+
 		# Bring cursor back up to top left corner
-		os.system('tput cup 0 0')
+		terminal.move(0, 0)
 		# print
 		for row in range(self.height+1):
-			col_string = ''
-			for col in range(self.width+1):
-				col_string += self.stage[col][(self.height - row)]
-			print col_string
+			terminal.write(self._row_text(frame, self.height - row, terminal.rep))
+			terminal.write('\n')
+
+		terminal.end_frame()
+
+		# remember what is on the screen now
+		if self.diff:
+			self._shown = self._copy_grid(frame)
+		return (self.width+1) * (self.height+1)
+
+	# print only the cells that differ from what the terminal shows
+	def _display_diff(self, stage, rows=None):
+		"""Sends cursor-addressed updates for the changed cells only.
+
+		Only the given rows (all rows if rows is None) are compared.
+		Neighbouring changed cells in a row are sent as one run (see
+		_changed_runs()).
+		"""
+		shown = self._shown
+		text = cell_text if self.compact else _same
+
+		if rows is None:
+			rows = range(self.height+1)
+
+		written = 0
+		terminal = self.terminal
+		terminal.begin_frame()
+
+		# move the text that only moved (see _shift_left())
+		for (x1, x2, y1, y2, n) in self._scrolls:
+			terminal.scroll_left(self.height - y2, self.height - y1, x1, x2, n)
+			# (the blanked cells are unknown, so they never match a cell)
+			if self._numpy:
+				self._shift_grid(shown, x1, x2, y1, y2, n)
+				shown[x2+1-n:x2+1, y1:y2+1] = UNKNOWN_CELL
+			else:
+				for x in range(x1, x2+1):
+					shown[x] = list(shown[x])
+				self._shift_grid(shown, x1, x2, y1, y2, n)
+				for x in range(x2+1-n, x2+1):
+					shown[x][y1:y2+1] = [None] * (y2+1-y1)
+		del self._scrolls[:]
+
+		for y in rows:
+			new = self._row_cells(stage, y)
+			old = self._row_cells(shown, y)
+			if new == old:
+				continue
+
+			row = self.height - y
+			for (start, end) in _changed_runs(terminal, row, new, old, text,
+											  terminal.rep):
+				# move cursor to the start of this run of changed cells
+				terminal.move(row, start)
+				terminal.write(_encode_cells([text(cell) for cell in new[start:end]],
+											 terminal.rep),
+							   end - start if end <= self.width else None)
+				if not self._numpy:
+					for x in range(start, end):
+						shown[x][y] = new[x]
+				written += end - start
+
+			if self._numpy:
+				shown[:, y] = stage[:, y]
+		terminal.end_frame()
+		return written
+
+	# show one change of an animation (the delay= of the drawing methods)
+	def _animate(self, delay):
+		"""Submits an animated change to the scheduler (or sleeps for delay
+		and displays, if there is no scheduler)."""
+		if self.render_thread is not None:
+			return
+		if self.scheduler is None:
+			sleep(delay)
+			self.display()
+		else:
+			self.scheduler.step(delay)
+
+	# show the end of an animation
+	def _animate_end(self, delay):
+		"""Displays whatever an animation has not displayed yet."""
+		if self.render_thread is not None:
+			return
+		if delay is not None and self.scheduler is not None:
+			self.scheduler.finish()
+
+	# mark the row of a cell as changed since the last display
+	def _touch(self, y):
+		"""Marks row y to be compared on the next differential display."""
+		self._dirty_rows.add(int(y) % (self.height+1))
+		self._generation += 1
+
+	# mark a range of rows as changed since the last display
+	def _touch_rows(self, y1, y2):
+		"""Marks rows y1 through y2 to be compared on the next differential
+		display."""
+		y_min = max(0, int(min(y1,y2)))
+		y_max = min(self.height, int(max(y1,y2)))
+		self._dirty_rows.update(range(y_min, y_max+1))
+		self._generation += 1
+
+	# compare every cell on the next display
+	def touch_all(self):
+		"""Marks the whole stage as changed.
+
+		Call this after writing to self.stage directly (instead of through
+		plot_point(), etc.) so that a differential display picks it up.
+		"""
+		self._all_dirty = True
+		self._generation += 1
+
+	# forget what the terminal shows, so the next display repaints everything
+	def invalidate(self):
+		"""Forces the next display() to reprint the whole stage."""
+		self._shown = None
+
+	# draw the border on columns of a grid
+	def _draw_border(self, grid, width, height, columns):
+		"""Draws the window border on the given columns (x-values) of a
+		(width+1) x (height+1) grid.  The corners get the same characters
+		as in a Window made at that size."""
+		(border_color, top, bottom, left, right) = self._border
+		for x in columns:
+			grid[x][height] = self._cell( top[x % len(top)], border_color )
+		if 0 in columns:
+			for y in range(height+1):
+				grid[0][y] = self._cell( left[y % len(left)], border_color )
+		if width in columns:
+			for y in range(height+1):
+				grid[width][y] = self._cell( right[y % len(right)], border_color )
+		for x in columns:
+			grid[x][0] = self._cell( bottom[x % len(bottom)], border_color )
+
+	# make a grid of a new size with the content of an old one
+	def _resize_grid(self, grid, width, height):
+		"""Returns grid (of the current size) resized to (width+1) x
+		(height+1) cells, with a new border.
+
+		What was inside the old border is kept where it still fits; the
+		newly exposed cells are blank.  If the height stays the same, the
+		old columns are kept as they are (shared, not copied).
+		"""
+		keep_w = min(self.width, width)
+		keep_h = min(self.height, height)
+		blank = self._plain(' ')
+
+		if self._numpy:
+			new = numpy.full((width+1, height+1), blank, dtype=numpy.uint32)
+			new[:keep_w, :keep_h] = grid[:keep_w, :keep_h]
+			self._draw_border(new, width, height, range(width+1))
+			return new
+
+		if self.compact:
+			fill = array('I', [blank])
+		else:
+			fill = [blank]
+		if height == self.height:
+			# only the new columns (and the new right border) are made
+			columns = list.__getitem__(grid, slice(0, keep_w))
+			changed = range(keep_w, width+1)
+		else:
+			# every column gets its top border moved
+			columns = [list.__getitem__(grid, x)[:keep_h] + fill * (height+1 - keep_h)
+					   for x in range(keep_w)]
+			changed = range(width+1)
+		columns += [fill * (height+1) for x in range(keep_w, width+1)]
+		self._draw_border(columns, width, height, changed)
+		return columns
+
+	# change the size of the window
+	def resize(self, size=None):
+		"""Changes the size of the window to size [width, height] (default:
+		the terminal's size, see terminal_size()).
+
+		The stage, the background, the blank stage, the snapshots and the
+		layers keep what fits, and only the border is drawn again.  Only the
+		new cells are sent on the next differential display -- unless the
+		height changed or the window got narrower, which moves the rows on
+		the terminal, so the whole window is printed again.
+
+		Returns True if the size changed.
+		"""
+		self._resize_pending = False
+		del self._scrolls[:]
+		if size is None:
+			(columns, lines) = terminal_size(self.terminal.stream)
+			size = [columns - 1, lines - 3]
+		(width, height) = (int(size[0]), int(size[1]))
+		if (width, height) == (self.width, self.height):
+			return False
+
+		# what the terminal shows
+		if height != self.height or width < self.width or self._numpy \
+		   or self._shown is None:
+			self._shown = None
+		else:
+			# the new columns are unknown, so they never match a cell
+			self._shown = list(self._shown) + \
+				[[None] * (height+1) for x in range(self.width+1, width+1)]
+
+		# every grid
+		self._own()
+		stage = self._resize_grid(self.stage, width, height)
+		self.blank = self._resize_grid(self.blank, width, height)
+		self.background = self._resize_grid(self.background, width, height)
+		for name in self.snapshots:
+			self.snapshots[name] = self._resize_grid(self.snapshots[name],
+													 width, height)
+		self.stage = stage if self._numpy else SharedGrid(stage)
+
+		# cells of the layers that are outside the new border
+		for layer in self.layers:
+			for y in list(layer.rows):
+				for x in [x for x in layer.rows[y] if x >= width or y >= height]:
+					layer._unset(x, y)
+			layer._dirty = set([(x,y) for (x,y) in layer._dirty
+								if x < width and y < height])
+		self._frame = None
+
+		# Convenience constants
+		self.width = width
+		self.height = height
+		self.mx = self.width
+		self.my = self.height
+		self.cx = self.width / 2
+		self.cy = self.height / 2
+
+		self._dirty_rows.clear()
+		self._all_dirty = True
+		self._generation += 1
+		return True
+
+	# resize the window when the terminal is resized
+	def watch_resize(self):
+		"""Resizes the window to the terminal's size on the next display()
+		after each SIGWINCH (a terminal resize).  Must be called from the
+		main thread."""
+		import signal
+		previous = signal.getsignal(signal.SIGWINCH)
+		def on_resize(signum, frame):
+			self._resize_pending = True
+			if callable(previous):
+				previous(signum, frame)
+		signal.signal(signal.SIGWINCH, on_resize)
+
+
+	#-------------------------------- LOOP -------------------------------------
+
+	# call a handler on every tick of run() / start()
+	def on_tick(self, handler):
+		"""Adds a tick handler for run() and start().
+
+		handler is called with the timestep (in seconds) on every tick.  It
+		can also be a Thing, whose tick() method is called.
+		"""
+		if hasattr(handler, 'tick'):
+			handler = handler.tick
+		self._tick_handlers.append(handler)
+		return handler
+
+	# call a handler with input read by run() / start()
+	def on_input(self, handler):
+		"""Adds an input handler for run() and start(); it is called with
+		whatever was read from the input."""
+		self._input_handlers.append(handler)
+		return handler
+
+	# is there anything that display() has not shown yet?
+	def is_dirty(self):
+		"""Returns True if anything was drawn since the last display(), or
+		a terminal resize is waiting for it (see watch_resize()).
+
+		Drawing straight into self.stage is not seen (see touch_all()).
+		"""
+		if self._all_dirty or self._dirty_rows or self._resize_pending:
+			return True
+		for layer in self.layers:
+			if layer._dirty:
+				return True
+		return False
+
+	# run the tick handlers on a running asyncio event loop
+	def start(self, tps=20, loop=None, input=None):
+		"""Starts running the tick handlers tps times per second on an
+		asyncio event loop (default: the running one), displaying the
+		window after ticks that drew something.
+
+		If input is given (e.g. sys.stdin), the loop also wakes up when it
+		can be read, and passes what was read to the input handlers.
+
+		The RenderLoop is also kept as self.render_loop, so handlers can
+		stop it with window.render_loop.stop().
+
+		returns: RenderLoop
+
+		"""
+		self.render_loop = RenderLoop(self, tps, loop, input)
+		return self.render_loop
+
+	# run the tick handlers until stopped
+	def run(self, tps=20, input=None, duration=None):
+		"""Runs the tick handlers tps times per second on a new asyncio event
+		loop, until a handler calls window.render_loop.stop() -- or for
+		duration seconds, if given.  See start() for input.
+
+		returns: number of ticks that were run
+
+		"""
+		import asyncio
+		loop = asyncio.new_event_loop()
+		try:
+			render_loop = self.start(tps, loop, input)
+			if duration is not None:
+				loop.call_later(duration, render_loop.stop)
+			return loop.run_until_complete(render_loop.done)
+		finally:
+			loop.close()
+
+
+	#------------------------------- LAYERS ------------------------------------
+
+	# add a layer that is drawn over the stage
+	def add_layer(self, name, z=None, ignore=None):
+		"""Adds a named Layer drawn over the stage and returns it.
+
+		Layers with a higher z are drawn over those with a lower z (the
+		default puts the new layer on top).  Characters equal to ignore are
+		left transparent when drawing images on the layer.
+		"""
+		if self.layer(name) is not None:
+			raise ValueError('there already is a layer named %r' % (name,))
+		if z is None:
+			z = max([layer.z for layer in self.layers] + [0]) + 1
+		layer = Layer(self, name, z, ignore)
+		self.layers.append(layer)
+		self._sort_layers()
+		return layer
+
+	# get a layer by name
+	def layer(self, name):
+		"""Returns the Layer with the given name, or None."""
+		for layer in self.layers:
+			if layer.name == name:
+				return layer
+		return None
+
+	# remove a layer (the cells it covered show what is below again)
+	def remove_layer(self, name):
+		"""Removes the Layer with the given name."""
+		layer = self.layer(name)
+		if layer is not None:
+			layer.clear()
+			self._recomposite(layer._dirty)
+			layer._dirty.clear()
+			self.layers.remove(layer)
+
+	# keep the layers in z order
+	def _sort_layers(self):
+		"""Sorts self.layers from the lowest to the highest z."""
+		self.layers.sort(key=lambda layer: layer.z)
+
+	# read a column of a grid without making the stage copy it
+	def _column(self, grid, x):
+		"""Returns grid[x] (without copy-on-write for a SharedGrid), to be
+		read only."""
+		if isinstance(grid, SharedGrid):
+			return grid.column(x)
+		return grid[x]
+
+	# read a cell of a grid without making the stage copy a shared column
+	def _peek(self, grid, x, y):
+		"""Returns grid[x][y] (without copy-on-write for a SharedGrid)."""
+		if isinstance(grid, SharedGrid):
+			return grid.column(x)[y]
+		return grid[x][y]
+
+	# work out what a single cell of the frame shows
+	def _composite_cell(self, x, y):
+		"""Returns the cell of the topmost visible layer covering (x,y), or
+		the stage's cell if no layer covers it."""
+		for layer in reversed(self.layers):
+			if layer.visible:
+				row = layer.rows.get(y)
+				if row is not None and x in row:
+					return row[x]
+		return self._peek(self.stage, x, y)
+
+	# put the cells of the layers covering a row onto the frame
+	def _overlay_row(self, frame, y):
+		"""Draws the cells every visible layer has in row y onto frame."""
+		for layer in self.layers:
+			if layer.visible:
+				row = layer.rows.get(y)
+				if row:
+					for x in row:
+						frame[x][y] = row[x]
+
+	# composite single cells again
+	def _recomposite(self, cells):
+		"""Updates the frame for a set of (x,y) cells."""
+		frame = self._frame
+		if frame is None:
+			return
+		for (x,y) in cells:
+			frame[x][y] = self._composite_cell(x, y)
+			self._dirty_rows.add(y)
+
+	# get the grid to display: the stage with the layers drawn over it
+	def _composite(self):
+		"""Returns the stage with all visible layers composited over it.
+
+		Only the rows touched on the stage and the cells changed on the
+		layers are composited again.
+		"""
+		if not self.layers:
+			self._frame = None
+			return self.stage
+
+		# composite everything
+		if self._frame is None or self._all_dirty:
+			frame = self._copy_grid(self.stage)
+			for y in range(self.height+1):
+				self._overlay_row(frame, y)
+			for layer in self.layers:
+				layer._dirty.clear()
+			self._frame = frame
+			self._all_dirty = True
+			return frame
+
+		# rows drawn on the stage
+		frame = self._frame
+		stage = self.stage
+		for y in self._dirty_rows:
+			if self._numpy:
+				frame[:, y] = stage[:, y]
+			else:
+				for x, cell in enumerate(self._row_cells(stage, y)):
+					frame[x][y] = cell
+			self._overlay_row(frame, y)
+
+		# cells changed on the layers (gathered first: _recomposite adds
+		# their rows to _dirty_rows)
+		rows = self._dirty_rows
+		cells = set()
+		for layer in self.layers:
+			if layer._dirty:
+				cells.update((x,y) for (x,y) in layer._dirty if y not in rows)
+				layer._dirty.clear()
+		self._recomposite(cells)
+
+		return frame
 
 
 	#------------------------------- POINTS ------------------------------------
@@ -182,6 +2550,45 @@ class Window(object):
 
 		return color_arg, on_color_arg, attrs_arg, character
 
+	# get a Style for color, on_color and attrs arguments
+	def style(self, *args, **kwargs):
+		"""Returns the Style for the same color arguments plot_point() takes.
+
+		Unknown colors are ignored, and invalid attributes give a plain Style,
+		just like plot_point() does.
+		"""
+		color_arg, on_color_arg, attrs_arg, character = \
+		self._get_character_args(*args, **kwargs)
+
+		if color_arg not in self.colors:
+			color_arg = None
+		if on_color_arg not in self.on_colors:
+			on_color_arg = None
+
+		try:
+			return Style(color_arg, on_color_arg, attrs_arg)
+		except:
+			return Style()
+
+	# get a Style and character from *args, **kwargs
+	def _get_style_args(self, *args, **kwargs):
+		"""Gets the Style and character from *args, **kwargs.
+
+		A Style given as style= is used as-is, without parsing the color
+		arguments.  The character is None if none was given.
+		"""
+		style = kwargs.get('style', None)
+		if style is None:
+			style = self.style(*args, **kwargs)
+
+		character = kwargs.get('character', None)
+		if character is None:
+			for arg in args:
+				if type(arg) == type('') and len(arg) == 1:
+					character = arg
+
+		return style, character
+
 	# returns True if two coordinates evaluate as the same point
 	def _points_are_equal(self, p1, p2):
 		"""
@@ -200,49 +2607,58 @@ class Window(object):
 
 	# plot a coordinate in a window list
 	def plot_point(self, coordinate, *args, **kwargs):
-		"""Plots a character at an (x,y) coordinate of self.stage"""
-		x = coordinate[0]
-		y = coordinate[1]
-		
+		"""Plots a character at an (x,y) coordinate of self.stage
+
+		The colors can be given as arguments (like 'red', 'on_blue',
+		attrs=['bold']) or resolved once as a Style and passed as style=.
+		"""
 		# get color arguments
-		color_arg, on_color_arg, attrs_arg, character = \
-		self._get_character_args(*args, **kwargs)
+		style, character = self._get_style_args(*args, **kwargs)
+		if character is None:
+			character = '.'
 
-		if color_arg not in self.colors:
-			color_arg = None
-		if on_color_arg not in self.on_colors:
-			on_color_arg = None
+		self._plot_styled(coordinate, character, style)
 
-		if 0 < x < self.width and 0 < y < self.height:
-			try:
-				self.stage[int(x+0.5)][int(y+0.5)] = colored(character,
-												     color=color_arg,
-												     on_color=on_color_arg,
-												     attrs=attrs_arg)
-			except:
-				self.stage[int(x+0.5)][int(y+0.5)] = character
+	# plot a character with an already resolved Style
+	def _plot_styled(self, coordinate, character, style):
+		"""Plots a character in a Style at an (x,y) coordinate, if it is
+		inside the border."""
+		x = coordinate[0]
+		y = coordinate[1]
+		if 0 < x < self.width and 0 < y < self.height:
+			self._touch(y+0.5)
+			self._own()
+			self.stage[int(x+0.5)][int(y+0.5)] = self._styled(character, style)
 	
 	# refresh a coordinate point back to its background
 	def erase_point(self, coordinate):
 		"""Returns a coordinate to its background value."""
 		x = int(coordinate[0])
 		y = int(coordinate[1])
+		self._touch(y)
+		self._own()
 		try:
-			self.stage[x][y] = self.background[x][y]
+			cell = self.background[x][y]
+			if self._peek(self.stage, x, y) != cell:
+				self.stage[x][y] = cell
 		except IndexError:
 			pass
 		except:
-			self.stage[x][y] = ' '
+			self.stage[x][y] = self._plain(' ')
 	
 	# delete a coordinate point (point becomes a single space)
 	def delete_point(self, coordinate):
 		"""Deletes a point on the stage (so it is a single space: ' ')."""
 		x = int(coordinate[0])
 		y = int(coordinate[1])
+		self._touch(y)
+		self._own()
 		try:
-			self.stage[x][y] = self.blank[x][y]
+			cell = self.blank[x][y]
+			if self._peek(self.stage, x, y) != cell:
+				self.stage[x][y] = cell
 		except:
-			self.stage[x][y] = ' '
+			self.stage[x][y] = self._plain(' ')
 	
 
 	#------------------------------- LISTS -------------------------------------
@@ -267,9 +2683,11 @@ class Window(object):
 		This is useful for drawing something and then being able to clear
 		or delete every point.
 		"""
-		# get character arguments
-		color_arg, on_color_arg, attrs_arg, character = \
-		self._get_character_args(*args, **kwargs)
+		# get character arguments, resolving the style once for every point
+		style, character = self._get_style_args(*args, **kwargs)
+		if character is None:
+			character = '.'
+		kwargs['style'] = style
 
 		# get image (or character) to draw at each point
 		image = kwargs.pop('image', character)
@@ -281,8 +2699,8 @@ class Window(object):
 		for coordinate in coordinate_list:
 			self.draw(coordinate, image, *args, **kwargs)
 			if delay is not None:
-				sleep(delay)
-				self.display()
+				self._animate(delay)
+		self._animate_end(delay)
 	
 	# refresh all coordinates in list back to their background
 	def erase_list(self, coordinate_list, *args, **kwargs):
@@ -297,8 +2715,8 @@ class Window(object):
 		for coordinate in coordinate_list:
 			self.erase_point(coordinate)
 			if delay is not None:
-				sleep(delay)
-				self.display()
+				self._animate(delay)
+		self._animate_end(delay)
 
 	# deletes all coordinate points in list (point becomes a single space)
 	def delete_list(self, coordinate_list, *args, **kwargs):
@@ -313,36 +2731,93 @@ class Window(object):
 		for coordinate in coordinate_list:
 			self.delete_point(coordinate)
 			if delay is not None:
-				sleep(delay)
-				self.display()
+				self._animate(delay)
+		self._animate_end(delay)
 
 
 	#------------------------------- AREAS ------------------------------------
 									
 
+	# clip a rectangular area defined by two corners to a range of cells
+	def _clip_area(self, c1, c2, x_min, x_max, y_min, y_max):
+		"""Returns the area between two opposite corners, clipped to
+		x_min..x_max and y_min..y_max, as slice bounds (x1, x2, y1, y2).
+
+		Returns None if nothing of the area is left.
+		"""
+		x1, x2 = sorted([int(c1[0]), int(c2[0])])
+		y1, y2 = sorted([int(c1[1]), int(c2[1])])
+		x1 = max(x1, x_min)
+		x2 = min(x2, x_max) + 1
+		y1 = max(y1, y_min)
+		y2 = min(y2, y_max) + 1
+		if x1 >= x2 or y1 >= y2:
+			return None
+		return x1, x2, y1, y2
+
+	# fill a clipped area of the stage with one cell value
+	def _fill_area(self, area, cell):
+		"""Sets every cell in a clipped area (see _clip_area()) to cell."""
+		x1, x2, y1, y2 = area
+		self._touch_rows(y1, y2-1)
+		self._own()
+		if self._numpy:
+			self.stage[x1:x2, y1:y2] = cell
+			return
+		if self.compact:
+			fill = array('I', [cell]) * (y2-y1)
+		else:
+			fill = [cell] * (y2-y1)
+		for x in range(x1, x2):
+			self.stage[x][y1:y2] = fill
+
+	# copy a clipped area of another grid onto the stage
+	def _copy_area(self, grid, area):
+		"""Copies a clipped area (see _clip_area()) of grid (like
+		self.background) onto the stage."""
+		x1, x2, y1, y2 = area
+		self._touch_rows(y1, y2-1)
+		self._own()
+		if self._numpy:
+			self.stage[x1:x2, y1:y2] = grid[x1:x2, y1:y2]
+			return
+
+		# whole columns are shared with the grid instead of copied
+		if (y1, y2) == (0, self.height+1) and isinstance(self.stage, SharedGrid):
+			for x in range(x1, x2):
+				self.stage.share(x, grid[x])
+			return
+		for x in range(x1, x2):
+			self.stage[x][y1:y2] = grid[x][y1:y2]
+
 	# plot a rectangular area defined by two corners
 	def plot_area(self, c1, c2, *args, **kwargs):
 		"""Plot points in a rectangular area defined by the coordinates of two
 		opposite corners of the rectangle"""
-		area = self._define_area(c1, c2)
-		for coordinate in area:
-			self.plot_point(coordinate, *args, **kwargs)
+		style, character = self._get_style_args(*args, **kwargs)
+		if character is None:
+			character = '.'
+
+		# only the drawable area (inside the border) is plotted
+		area = self._clip_area(c1, c2, 1, self.width-1, 1, self.height-1)
+		if area is not None:
+			self._fill_area(area, self._styled(character, style))
 
 	# erase a rectangular area defined by two corners
 	def erase_area(self, c1, c2):
 		"""Erase points in a rectangular area defined by the coordinates of two
 		opposite corners of the rectangle"""
-		area = self._define_area(c1, c2)
-		for coordinate in area:
-			self.erase_point(coordinate)
+		area = self._clip_area(c1, c2, 0, self.width, 0, self.height)
+		if area is not None:
+			self._copy_area(self.background, area)
 
 	# erase a rectangular area defined by two corners
 	def delete_area(self, c1, c2):
 		"""Delete points in a rectangular area defined by the coordinates of two
 		opposite corners of the rectangle"""
-		area = self._define_area(c1, c2)
-		for coordinate in area:
-			self.delete_point(coordinate)
+		area = self._clip_area(c1, c2, 0, self.width, 0, self.height)
+		if area is not None:
+			self._copy_area(self.blank, area)
 
 
 	#------------------------------- IMAGES ------------------------------------
@@ -368,30 +2843,139 @@ class Window(object):
 
 		NOTE:  In forms (2) and (3), each string should be the same length.
 
+		The colors are resolved once for the whole image; pass style= to skip
+		even that.
+
 		"""
-		x = coordinate[0]
-		y = coordinate[1]
+		# a compiled image already has its colors
+		if isinstance(image, Sprite):
+			self.blit(coordinate, image)
+			return
 
 		# Get an igore character (to avoid drawing blank spaces)
 		ignore = kwargs.get('ignore', None)
 
+		# Get the style, and a character to draw instead of the image's own
+		style, character = self._get_style_args(*args, **kwargs)
+
+		self._draw_image(coordinate, image, self._plot_styled, style, character,
+						 ignore)
+
+	# compile an image for fast drawing
+	def sprite(self, image, *args, **kwargs):
+		"""Returns a Sprite of an image, taking the same arguments as draw().
+
+		Drawing the Sprite (with draw() or blit()) gives the same result as
+		drawing the image with these arguments, without parsing them again.
+		"""
+		ignore = kwargs.get('ignore', None)
+		style, character = self._get_style_args(*args, **kwargs)
+		return Sprite(image, style, ignore, character)
+
+	# draw a compiled image
+	def blit(self, coordinate, sprite):
+		"""Draws a Sprite with its top left character at a coordinate.
+		Only the part inside the border is drawn."""
+		self._generation += 1
+		self._blit(coordinate, sprite)
+
+	# draw a compiled image for a Thing
+	def _blit(self, coordinate, sprite):
+		"""blit(), without counting as a change to the Things under it (a
+		Thing marks those itself, see Thing.move())."""
+		x = self._round(coordinate[0])
+		y = self._round(coordinate[1])
+		self._own()
+		stage = self.stage
+		for j, spans in enumerate(sprite._spans(self)):
+			row = y - j
+			if not 0 < row < self.height or not spans:
+				continue
+			self._dirty_rows.add(row)
+			for (i, cells) in spans:
+				# clip the span to the drawable columns
+				start = max(x + i, 1)
+				end = min(x + i + len(cells), self.width)
+				if start >= end:
+					continue
+				first = start - (x + i)
+				if self._numpy:
+					stage[start:end, row] = cells[first:first + end - start]
+				else:
+					for k in range(end - start):
+						stage[start + k][row] = cells[first + k]
+
+	# erase a compiled image
+	def erase_sprite(self, coordinate, sprite):
+		"""Returns the cells a Sprite drawn at a coordinate covers (its opaque
+		characters only) to their background value."""
+		self._generation += 1
+		self._erase_sprite(coordinate, sprite)
+
+	# erase a compiled image for a Thing
+	def _erase_sprite(self, coordinate, sprite):
+		"""erase_sprite(), without counting as a change to the Things under
+		it."""
+		x = self._round(coordinate[0])
+		y = self._round(coordinate[1])
+		self._restore_cells(x, y, sprite._cell_map(self))
+
+	# restore cells at offsets from a position to the background
+	def _restore_cells(self, x, y, offsets):
+		"""Sets the stage cell at each (x+i, y-j) of offsets (i, j) inside the
+		border back to the background."""
+		self._own()
+		stage = self.stage
+		background = self.background
+		for (i, j) in offsets:
+			if 0 < x + i < self.width and 0 < y - j < self.height:
+				stage[x + i][y - j] = background[x + i][y - j]
+				self._dirty_rows.add(y - j)
+
+	# move a compiled image, writing only the cells that change
+	def _move_sprite(self, sprite, p1, p2):
+		"""Moves a Sprite drawn at p1 to p2.
+
+		The cells it no longer covers are erased, and only the cells that
+		now show a different character are drawn, so a small step costs
+		about the sprite's outline instead of its area.  This expects the
+		cells under the sprite to still show it (Thing.move() checks that).
+		"""
+		x1, y1 = self._round(p1[0]), self._round(p1[1])
+		x2, y2 = self._round(p2[0]), self._round(p2[1])
+		vacated, changed = sprite._move(self, x2 - x1, y2 - y1)
+		self._restore_cells(x1, y1, vacated)
+
+		stage = self.stage
+		for (i, j, cell) in changed:
+			if 0 < x2 + i < self.width and 0 < y2 - j < self.height:
+				stage[x2 + i][y2 - j] = cell
+				self._dirty_rows.add(y2 - j)
+
+	# plot each character of an image with a plot function
+	def _draw_image(self, coordinate, image, plot, style, character, ignore):
+		"""Calls plot(coordinate, character, style) for each character of an
+		image (see draw()) that is not the ignore character."""
+		x = coordinate[0]
+		y = coordinate[1]
+
 		# list of lists
 		if type(image) == type([0]) and type(image[0]) == type([0]):
 			for j in range( len(image) ):
 				for i in range( len(image[j][0]) ):
 					if image[j][0][i] != ignore:
-						self.plot_point( ((x+i), (y-j)), image[j][0][i], *args, **kwargs)
+						plot( ((x+i), (y-j)), character or image[j][0][i], style)
 		# list of strings
 		elif type(image) == type([0]) and type(image[0]) == type(''):
 			for j in range( len(image) ):
 				for i in range( len(image[j]) ):
 					if image[j][i] != ignore:
-						self.plot_point( ((x+i), (y-j)), image[j][i], *args, **kwargs)
+						plot( ((x+i), (y-j)), character or image[j][i], style)
 		# string
 		elif type(image) == type(''):
 			for i in range( len(image) ):
 				if image[i] != ignore:
-					self.plot_point( ((x+i), y), image[i], *args, **kwargs)
+					plot( ((x+i), y), character or image[i], style)
 		# invalid
 		else:
 			return
@@ -580,6 +3164,200 @@ class Window(object):
 
 		return coordinate_list
 	
+	# round a coordinate value to the cell it is plotted in
+	def _round(self, a):
+		"""Rounds a coordinate value to a cell index (like plot_point())."""
+		return int(math.floor(a + 0.5))
+
+	# rasterize one line along its longer axis, with integers only
+	def _rasterize(self, a1, b1, da, db, a_lo, a_hi, b_lo, b_hi, line, step):
+		"""Returns the cells [(a,b), ...] of the line through (a1,b1) with
+		direction (da,db), where |da| >= |db|, clipped to a_lo..a_hi and
+		b_lo..b_hi before walking.
+
+		b is b1 + (a-a1)*db/da rounded half up, worked out with integers.
+		"""
+		# domain of the line
+		if line == 'segment':
+			a_start, a_end = min(a1, a1+da), max(a1, a1+da)
+		elif line == 'ray':
+			if da > 0:
+				a_start, a_end = a1, a_hi
+			elif da < 0:
+				a_start, a_end = a_lo, a1
+			else:
+				a_start, a_end = a1, a1
+		else:
+			a_start, a_end = a_lo, a_hi
+
+		# walk from lower to higher a
+		if da < 0:
+			da, db = -da, -db
+		elif da == 0:
+			da = 1
+
+		# clip to the a bounds, and to the a-range where b is in its bounds:
+		#	b_lo <= b(a)  <=>  (a-a1)*2*db >= 2*da*(b_lo-b1) - da
+		#	b(a) <= b_hi  <=>  (a-a1)*2*db <  2*da*(b_hi-b1+1) - da
+		a_start = max(a_start, a_lo)
+		a_end = min(a_end, a_hi)
+		if db == 0:
+			if not b_lo <= b1 <= b_hi:
+				return []
+		else:
+			d = 2*db
+			k_lo = 2*da*(b_lo-b1) - da
+			k_hi = 2*da*(b_hi-b1+1) - da
+			if d > 0:
+				a_start = max(a_start, a1 - (-k_lo // d))
+				a_end = min(a_end, a1 - (-k_hi // d) - 1)
+			else:
+				a_start = max(a_start, a1 + k_hi // d + 1)
+				a_end = min(a_end, a1 + k_lo // d)
+		if a_start > a_end:
+			return []
+
+		# walk, keeping the numerator of b's fraction
+		cells = []
+		n = (a_start - a1)*2*db + da
+		for a in range(a_start, a_end+1):
+			b = b1 + n // (2*da)
+			n += 2*db
+			if step == 'step' or b != b1 + n // (2*da):
+				cells.append((a,b))
+		return cells
+
+	# rasterize many line segments in one call
+	def rasterize_segments(self, segments, line='segment', step='step',
+						   endpoints=True):
+		"""Returns the cells of many lines as two arrays: xs, ys.
+
+		segments is a list of (p1, p2) pairs, taking the same p1, p2, line,
+		step and endpoints values as plot_line().  The end points are
+		rounded to their cells first, then each line is clipped to the
+		drawable area and walked with integer arithmetic only.  The cells
+		of each line come in order of its longer axis.
+
+		returns: xs, ys (array('i') of x- and y-values)
+
+		"""
+		xs = array('i')
+		ys = array('i')
+		x_lo, x_hi = 1, self.width-1
+		y_lo, y_hi = 1, self.height-1
+
+		for (p1, p2) in segments:
+			x1 = self._round(p1[0])
+			y1 = self._round(p1[1])
+			line_type = line
+			step_type = step
+
+			# define x2 and y2 if p2 is not a coordinate
+			if p2 == 'vertical':
+				x2, y2 = x1, y1 + 1
+				line_type = 'line'
+				step_type = 'step'
+			elif p2 == 'horizontal':
+				x2, y2 = x1 + 1, y1
+				line_type = 'line'
+				step_type = 'step'
+			else:
+				x2 = self._round(p2[0])
+				y2 = self._round(p2[1])
+
+			# walk along the longer axis
+			if abs(x2-x1) >= abs(y2-y1):
+				cells = self._rasterize(x1, y1, x2-x1, y2-y1, x_lo, x_hi,
+										y_lo, y_hi, line_type, step_type)
+			else:
+				cells = self._rasterize(y1, x1, y2-y1, x2-x1, y_lo, y_hi,
+										x_lo, x_hi, line_type, step_type)
+				cells = [(b,a) for (a,b) in cells]
+
+			# remove endpoints if desired:
+			if endpoints == False:
+				cells = cells[1:-1]
+
+			for (x,y) in cells:
+				xs.append(x)
+				ys.append(y)
+
+		return xs, ys
+
+	# rasterize a line with integer arithmetic
+	def rasterize_line(self, p1, p2, line='segment', step='step', endpoints=True):
+		"""Returns the cells of a line as two arrays: xs, ys.
+
+		Takes the same arguments as plot_line(), but only uses integers
+		and only walks the part of the line inside the drawable area.
+		See rasterize_segments() for drawing many lines at once.
+
+		returns: xs, ys (array('i') of x- and y-values)
+
+		"""
+		return self.rasterize_segments([(p1, p2)], line, step, endpoints)
+
+	# set the stage cells at lists of x- and y-values
+	def _plot_cells(self, xs, ys, cell):
+		"""Sets the stage cell at each (xs[k], ys[k]) to cell.
+
+		The cells must be on the stage (like the ones from
+		rasterize_segments()).
+		"""
+		if not len(xs):
+			return
+		self._own()
+		if self._numpy:
+			self.stage[numpy.asarray(xs, dtype=int), numpy.asarray(ys, dtype=int)] = cell
+		else:
+			stage = self.stage
+			for k in range(len(xs)):
+				stage[xs[k]][ys[k]] = cell
+		self._dirty_rows.update(ys)
+		self._generation += 1
+
+	# plot an image at each cell of lists of x- and y-values
+	def _plot_image_cells(self, xs, ys, image, style, character=None, ignore=None):
+		"""Draws image (a single character is plotted directly) at each
+		(xs[k], ys[k])."""
+		if type(image) == type('') and len(image) == 1 and image != ignore:
+			self._plot_cells(xs, ys, self._styled(character or image, style))
+		else:
+			for k in range(len(xs)):
+				self._draw_image((xs[k], ys[k]), image, self._plot_styled, style,
+								 character, ignore)
+
+	# plot a cell at the positions in NumPy arrays
+	def _plot_array(self, xs, ys, cell):
+		"""Like _plot_cells(), for NumPy arrays of x- and y-values."""
+		if not len(xs):
+			return
+		self._own()
+		if self._numpy:
+			self.stage[xs, ys] = cell
+		else:
+			stage = self.stage
+			for (x, y) in zip(xs.tolist(), ys.tolist()):
+				stage[x][y] = cell
+		self._dirty_rows.update(numpy.unique(ys).tolist())
+		self._generation += 1
+
+	# erase the positions in NumPy arrays
+	def _restore_array(self, xs, ys):
+		"""Sets the stage cell at each (xs[k], ys[k]) back to the background."""
+		if not len(xs):
+			return
+		self._own()
+		if self._numpy:
+			self.stage[xs, ys] = self.background[xs, ys]
+		else:
+			stage = self.stage
+			background = self.background
+			for (x, y) in zip(xs.tolist(), ys.tolist()):
+				stage[x][y] = background[x][y]
+		self._dirty_rows.update(numpy.unique(ys).tolist())
+		self._generation += 1
+
 	# plot a line given coordinates, character, line type, and step type
 	def plot_line(self, p1, p2, *args, **kwargs):
 		"""Plots a line defined by points p1 and p2.
@@ -666,27 +3444,47 @@ class Window(object):
 		If delay is given (float), it will appear to "animate", with a delay
 		between each "frame".
 
+		The lines are rasterized with integers (see rasterize_segments()),
+		all in one call when there is no delay.
+
+		returns: list of the (x,y) cells of the lines
+
 		"""
-		# get character arguments
-		color_arg, on_color_arg, attrs_arg, character = \
-		self._get_character_args(*args, **kwargs)
+		if not coordinate_list:
+			return []
+
+		# get character arguments, resolving the style once
+		style, character = self._get_style_args(*args, **kwargs)
+		kwargs['style'] = style
+		ignore = kwargs.get('ignore', None)
+		line = kwargs.get('line', 'segment')
+		step = kwargs.get('step', 'step')
+
+		# segments between consecutive points (and the last one, if desired)
+		segments = list(zip(coordinate_list[:-1], coordinate_list[1:]))
+		if wrap == True and len(coordinate_list) > 1:
+			segments.append((coordinate_list[-1], coordinate_list[0]))
 
 		# plot first point
 		self.draw(coordinate_list[0], image, *args, **kwargs)
 
-		# plot the last line, if desired
-		if wrap == True:
-			line_list += self.plot_line(coordinate[0], coordinate[-1], *args, **kwargs)
+		# plot all lines at once
+		if delay is None:
+			xs, ys = self.rasterize_segments(segments, line, step)
+			self._plot_image_cells(xs, ys, image, style, character, ignore)
+			for coordinate in coordinate_list[1:]:
+				self.draw(coordinate, image, *args, **kwargs)
+			return list(zip(xs, ys))
 
-		# plot the rest of points, and plot lines between each consecutive points
+		# plot the lines one at a time
 		line_list = []
-		for i in range(1, len(coordinate_list)):
-			line_list += self.plot_line(coordinate_list[i-1], coordinate_list[i],
-									    image=image, *args, **kwargs)
-			self.draw(coordinate_list[i], image=image, *args, **kwargs)
-			if delay is not None:
-				sleep(delay)
-				self.display()
+		for i in range(len(segments)):
+			xs, ys = self.rasterize_segments([segments[i]], line, step)
+			self._plot_image_cells(xs, ys, image, style, character, ignore)
+			self.draw(segments[i][1], image, *args, **kwargs)
+			line_list += list(zip(xs, ys))
+			self._animate(delay)
+		self._animate_end(delay)
 
 		return line_list
 			
@@ -697,15 +3495,14 @@ class Window(object):
 	def draw_axis(self, axis='x', position=0, *args, **kwargs):
 		"""Draws a simple x- or y-axis."""
 		if axis.lower() == 'x':
-			x = 1
-			y = position
-			self.plot_line( (x,y), 'horizontal', '-', *args, **kwargs )
+			xs, ys = self.rasterize_line((1, position), 'horizontal')
+			style, character = self._get_style_args('-', *args, **kwargs)
 		elif axis.lower() == 'y':
-			x = position
-			y = 1
-			self.plot_line( (x,y), 'vertical', '|', *args, **kwargs )
+			xs, ys = self.rasterize_line((position, 1), 'vertical')
+			style, character = self._get_style_args('|', *args, **kwargs)
 		else:
 			return False
+		self._plot_cells(xs, ys, self._styled(character, style))
 
 	# draw x and y axes and a 0 at the origin
 	def draw_axes(self, origin, *args, **kwargs):
@@ -724,11 +3521,17 @@ class Window(object):
 		pass
 
 	# generate a list of coordinates for plotting a function
-	def graph_coordinates(self, function, origin=(0,0), scale=[2,1], bounds=None):
+	def graph_coordinates(self, function, origin=(0,0), scale=[2,1], bounds=None,
+						  vectorize=False):
 		"""
 		Generate coordinate list for a function at the specified origin or in the
 		specified x and y range.
 
+		If vectorize=True (and NumPy is available), the function is called
+		once with a NumPy array of every x-value, and points that are not
+		finite numbers are left out.  Functions that cannot take an array
+		(e.g. ones using math.sin) are called once per column instead.
+
 		returns: coordinate_list, (x0,y0)
 
 		"""
@@ -743,6 +3546,13 @@ class Window(object):
 			(x0,y0) = origin
 			[scale_x, scale_y] = scale
 
+		# graph function for the whole x-domain at once
+		if vectorize and numpy is not None:
+			coordinate_list = self._graph_vectorized(function, x0, y0,
+													 scale_x, scale_y)
+			if coordinate_list is not None:
+				return coordinate_list, (x0,y0)
+
 		# graph function (shifted and scaled)
 		coordinate_list = []
 		for i in range(self.width):
@@ -756,6 +3566,24 @@ class Window(object):
 
 		return coordinate_list, (x0,y0)
 
+	# generate graph coordinates with one call of the function on an array
+	def _graph_vectorized(self, function, x0, y0, scale_x, scale_y):
+		"""Returns the coordinate list for graph_coordinates() by calling
+		function on an array of all x-values, or None if it can't take one."""
+		i = numpy.arange(self.width)
+		x = (i - x0) * scale_x
+		try:
+			with numpy.errstate(all='ignore'):
+				y = numpy.asarray(function(x), dtype=float)
+				y = numpy.broadcast_to(y, x.shape)
+				j = (y / scale_y) + y0
+		except Exception:
+			return None
+
+		# drop invalid points (like a division by zero) with a mask
+		valid = numpy.isfinite(j)
+		return list(zip(i[valid].tolist(), j[valid].tolist()))
+
 	# graph a function
 	def graph(self, function, origin=(0,0), scale=[2,1],
 			  bounds=None, axis='xy', axis_color=None, delay=None,
@@ -767,6 +3595,9 @@ class Window(object):
 		If delay is a non-zero number, then the graph will "animate" with the 
 		specified delay after each "frame".
 
+		If vectorize=True, the function is evaluated for all columns in one
+		call (see graph_coordinates()).
+
 		returns: coordinate_list, (x0,y0)
 
 		"""
@@ -776,12 +3607,16 @@ class Window(object):
 
 		# get image (or character) to draw at each point
 		image = kwargs.pop('image', character)
+
+		# evaluate the function on an array of all x-values?
+		vectorize = kwargs.pop('vectorize', False)
 		
 		# generate list of coordinates for plotting
 		coordinate_list, (x0,y0) = self.graph_coordinates(function,
 														  origin=origin,
 														  scale=scale,
-														  bounds=bounds)
+														  bounds=bounds,
+														  vectorize=vectorize)
 		
 		# Drax axes (or axis)
 		if axis is None:
@@ -804,68 +3639,576 @@ class Window(object):
 
 		return coordinate_list, (x0,y0)
 
-	# draw lines under a function (ex: for integral)
-	def draw_under(self, coordinate_list, origin=(0,0), d='x', delay=None,
-				   *args, **kwargs):
+	# get the line segments from a graph's points to its axis
+	def _under_segments(self, coordinate_list, origin, d):
+		"""Returns (point, axis_point) cell pairs for draw_under() and
+		erase_under(), leaving out points on the origin axis."""
 		(x0,y0) = origin
-		
-		fill_list = []
-		for coordinate in coordinate_list:
-			(x,y) = coordinate
-
-			# get vertical fill lines for dx,
-			#     horizontal fill lines for dy
+		segments = []
+		for (x,y) in coordinate_list:
+			# vertical fill lines for dx, horizontal fill lines for dy
 			if d.lower() == 'x':
-				y += 0.5
-				axis_point = (x, (y0+0.5))
+				point = (self._round(x), self._round(y))
+				axis_point = (point[0], self._round(y0))
 			elif d.lower() == 'y':
-				x += 0.5
-				axis_point = ((x0+0.5), y)
+				point = (self._round(x), self._round(y))
+				axis_point = (self._round(x0), point[1])
 
-			# draw line from function value to origin, excluding endpoints
 			# (do not draw over origin axis)
 			if int(x) != int(x0):
-				to_fill = self.plot_line((x,y), axis_point, endpoints=False,
-										   *args, **kwargs)
-				fill_list += to_fill
+				segments.append((point, axis_point))
+			else:
+				segments.append(None)
+		return segments
 
-			if delay is not None:
-				sleep(delay)
-				self.display()
+	# draw lines under a function (ex: for integral)
+	def draw_under(self, coordinate_list, origin=(0,0), d='x', delay=None,
+				   *args, **kwargs):
+		"""Fills the space between a graph and its axis (d='x': vertical lines,
+		d='y': horizontal lines), excluding the graph and the axis.
+
+		An image= is drawn at each filled cell (like plot_list() does).
+
+		returns: list of the (x,y) cells that were filled
+
+		"""
+		style, character = self._get_style_args(*args, **kwargs)
+		image = kwargs.get('image', character or '.')
+		ignore = kwargs.get('ignore', None)
+		segments = self._under_segments(coordinate_list, origin, d)
+
+		# fill everything at once
+		if delay is None:
+			xs, ys = self.rasterize_segments([s for s in segments if s],
+											 endpoints=False)
+			self._plot_image_cells(xs, ys, image, style, None, ignore)
+			return list(zip(xs, ys))
+
+		# fill one line at a time
+		fill_list = []
+		for segment in segments:
+			if segment is not None:
+				xs, ys = self.rasterize_segments([segment], endpoints=False)
+				self._plot_image_cells(xs, ys, image, style, None, ignore)
+				fill_list += list(zip(xs, ys))
+			self._animate(delay)
+		self._animate_end(delay)
 
 		return fill_list
 
-	# draw lines under a function (ex: for integral)
+	# erase lines under a function (ex: for integral)
 	def erase_under(self, coordinate_list, origin=(0,0), d='x', delay=None,
 				   *args, **kwargs):
-		(x0,y0) = origin
+		"""Erases what draw_under() filled in, without erasing the graph's own
+		points."""
+		graph = set([(self._round(x), self._round(y)) for (x,y) in coordinate_list])
 		
-		for coordinate in coordinate_list:
-			(x,y) = coordinate
-
-			# get vertical fill lines for dx,
-			#     horizontal fill lines for dy
-			if d.lower() == 'x':
-				y += 0.5
-				axis_point = (x, (y0+0.5))
-			elif d.lower() == 'y':
-				x += 0.5
-				axis_point = ((x0+0.5), y)
-
-			# draw line from function value to origin, excluding endpoints
-			# (do not draw over origin axis)
-			if int(x) != int(x0):
-				clear_line = self._define_line((x,y), axis_point, endpoints=False,
-										       *args, **kwargs)
+		for segment in self._under_segments(coordinate_list, origin, d):
+			if segment is not None:
+				xs, ys = self.rasterize_segments([segment], endpoints=False)
 
 				# erase all points in current cross-section up until graph
-				for point in clear_line:
-					if point not in coordinate_list:
-						self.erase_point(point)
+				for k in range(len(xs)):
+					if (xs[k], ys[k]) not in graph:
+						self.erase_point((xs[k], ys[k]))
 
 			if delay is not None:
-				sleep(delay)
-				self.display()
+				self._animate(delay)
+		self._animate_end(delay)
+
+
+# Layer of cells drawn over a Window's stage
+class Layer(object):
+	"""
+	A named layer of cells drawn over the stage of a Window.
+
+	Cells that were never drawn on the layer (or were erased) are
+	transparent, so the layers below, and finally the stage, show through.
+	Layers with a higher z are drawn over those with a lower z.
+
+	Only the cells a layer changes are composited again on the next
+	display(), so a sprite moving on its own layer over a static graph
+	costs about the sprite's size per frame -- and erasing it shows the
+	graph again without redrawing anything.
+
+	Make layers with Window.add_layer().
+
+	"""
+	def __init__(self, window, name, z=0, ignore=None):
+		"""
+		Initializes an (empty, transparent) Layer of a Window.
+
+			self.rows   -- the layer's cells, as {y: {x: cell}}
+			self.ignore -- default character to leave transparent in draw()
+
+		"""
+		self.window = window
+		self.name = name
+		self.z = z
+		self.ignore = ignore
+		self.visible = True
+		self.rows = {}
+		self._dirty = set()		# cells changed since the last display
+		self._generation = 0	# writes not made by Things (see Thing.move())
+
+	# set a cell of the layer
+	def _set(self, x, y, cell):
+		"""Sets the cell at (x,y), if it is inside the border."""
+		self._generation += 1
+		self._put(x, y, cell)
+
+	# set a cell of the layer for a Thing
+	def _put(self, x, y, cell):
+		"""_set(), without counting as a change to the Things under it."""
+		if 0 < x < self.window.width and 0 < y < self.window.height:
+			self.rows.setdefault(y, {})[x] = cell
+			self._dirty.add((x,y))
+
+	# make a cell of the layer transparent
+	def _unset(self, x, y):
+		"""Makes the cell at (x,y) transparent."""
+		self._generation += 1
+		self._take(x, y)
+
+	# make a cell of the layer transparent for a Thing
+	def _take(self, x, y):
+		"""_unset(), without counting as a change to the Things under it."""
+		row = self.rows.get(y)
+		if row is not None and x in row:
+			del row[x]
+			if not row:
+				del self.rows[y]
+			self._dirty.add((x,y))
+
+	# plot a character with an already resolved Style
+	def _plot_styled(self, coordinate, character, style):
+		"""Plots a character in a Style at an (x,y) coordinate."""
+		x = int(coordinate[0]+0.5)
+		y = int(coordinate[1]+0.5)
+		self._set(x, y, self.window._styled(character, style))
+
+	# plot a coordinate on the layer
+	def plot_point(self, coordinate, *args, **kwargs):
+		"""Plots a character at an (x,y) coordinate of the layer.
+		Takes the same arguments as Window.plot_point()."""
+		style, character = self.window._get_style_args(*args, **kwargs)
+		self._plot_styled(coordinate, character or '.', style)
+
+	# draw a multi-character "image" on the layer
+	def draw(self, coordinate, image, *args, **kwargs):
+		"""Draws an ASCII-text image at a coordinate of the layer.
+		Takes the same arguments as Window.draw(); characters equal to
+		ignore (default: self.ignore) stay transparent."""
+		if isinstance(image, Sprite):
+			self.blit(coordinate, image)
+			return
+		ignore = kwargs.get('ignore', None)
+		if ignore is None:
+			ignore = self.ignore
+		style, character = self.window._get_style_args(*args, **kwargs)
+		self.window._draw_image(coordinate, image, self._plot_styled, style,
+								character, ignore)
+
+	# draw a compiled image on the layer
+	def blit(self, coordinate, sprite):
+		"""Draws a Sprite with its top left character at a coordinate of
+		the layer."""
+		self._generation += 1
+		self._blit(coordinate, sprite)
+
+	# draw a compiled image on the layer for a Thing
+	def _blit(self, coordinate, sprite):
+		x = self.window._round(coordinate[0])
+		y = self.window._round(coordinate[1])
+		for j, spans in enumerate(sprite._spans(self.window)):
+			for (i, cells) in spans:
+				for k in range(len(cells)):
+					self._put(x + i + k, y - j, cells[k])
+
+	# erase a compiled image from the layer
+	def erase_sprite(self, coordinate, sprite):
+		"""Makes the cells a Sprite drawn at a coordinate covers transparent."""
+		self._generation += 1
+		self._erase_sprite(coordinate, sprite)
+
+	# erase a compiled image from the layer for a Thing
+	def _erase_sprite(self, coordinate, sprite):
+		x = self.window._round(coordinate[0])
+		y = self.window._round(coordinate[1])
+		for (i, j) in sprite._cell_map(self.window):
+			self._take(x + i, y - j)
+
+	# move a compiled image, changing only the cells that change
+	def _move_sprite(self, sprite, p1, p2):
+		"""Moves a Sprite drawn at p1 to p2 (see Window._move_sprite())."""
+		window = self.window
+		x1, y1 = window._round(p1[0]), window._round(p1[1])
+		x2, y2 = window._round(p2[0]), window._round(p2[1])
+		vacated, changed = sprite._move(window, x2 - x1, y2 - y1)
+		for (i, j) in vacated:
+			self._take(x1 + i, y1 - j)
+		for (i, j, cell) in changed:
+			self._put(x2 + i, y2 - j, cell)
+
+	# make a coordinate transparent again
+	def erase_point(self, coordinate):
+		"""Makes the cell at an (x,y) coordinate transparent."""
+		self._unset(int(coordinate[0]), int(coordinate[1]))
+
+	# make a rectangular area transparent again
+	def erase_area(self, c1, c2):
+		"""Makes every cell in a rectangular area defined by two opposite
+		corners transparent."""
+		x1, x2 = sorted([int(c1[0]), int(c2[0])])
+		y1, y2 = sorted([int(c1[1]), int(c2[1])])
+		for y in list(self.rows):
+			if y1 <= y <= y2:
+				for x in [x for x in self.rows[y] if x1 <= x <= x2]:
+					self._unset(x, y)
+
+	# make the whole layer transparent
+	def clear(self):
+		"""Erases every cell of the layer."""
+		self._touch_all()
+		self.rows = {}
+		self._generation += 1
+
+	# mark every cell of the layer to be composited again
+	def _touch_all(self):
+		"""Marks every cell of the layer as changed."""
+		for y in self.rows:
+			for x in self.rows[y]:
+				self._dirty.add((x,y))
+
+	# show the layer
+	def show(self):
+		"""Makes the layer visible."""
+		self.visible = True
+		self._touch_all()
+
+	# hide the layer (without forgetting its cells)
+	def hide(self):
+		"""Makes the layer invisible."""
+		self.visible = False
+		self._touch_all()
+
+	# move the layer up or down the stack
+	def set_z(self, z):
+		"""Changes the layer's z (its place in the stack of layers)."""
+		self.z = z
+		self.window._sort_layers()
+		self._touch_all()
+
+
+# ASCII-text image compiled for fast drawing
+class Sprite(object):
+	"""
+	An image (in any of the three forms Window.draw() takes) compiled once,
+	with its style and ignore character, for fast drawing.
+
+		sprite = window.sprite(['/-\\', '\\-/'], 'green', ignore=' ')
+		window.draw((10,5), sprite)			# or window.blit((10,5), sprite)
+
+	Drawing a Sprite does not look at the image or the color arguments
+	again: it copies rows of ready-made cells onto the stage.  The cells are
+	made once for each kind of storage the sprite is drawn on.
+
+		self.width, self.height -- size of the image
+		self.spans -- for each row j (counted down from the top), a list of
+					  (i, text): runs of opaque characters starting at column i
+		self.mask  -- set of the (i, j) offsets of the opaque characters
+
+	"""
+	def __init__(self, image, style=None, ignore=None, character=None):
+		self.image = image
+		self.style = Style() if style is None else style
+		self.ignore = ignore
+		self.character = character
+
+		# rows of the image as strings
+		if type(image) == type([0]) and image and type(image[0]) == type([0]):
+			rows = [row[0] for row in image]
+		elif type(image) == type([0]) and image and type(image[0]) == type(''):
+			rows = list(image)
+		elif type(image) == type(''):
+			rows = [image]
+		else:
+			rows = []
+		self.width = len(rows[0]) if rows else 0
+		self.height = len(rows)
+
+		# runs of opaque characters
+		self.spans = []
+		self.mask = set()
+		for j, row in enumerate(rows):
+			spans = []
+			i = 0
+			while i < len(row):
+				if row[i] == ignore:
+					i += 1
+					continue
+				start = i
+				while i < len(row) and row[i] != ignore:
+					self.mask.add((i, j))
+					i += 1
+				text = row[start:i]
+				if character:
+					text = character * len(text)
+				spans.append((start, text))
+			self.spans.append(spans)
+
+		self._cells = {}		# storage -> spans of stage cells
+		self._maps = {}			# storage -> {(i, j): cell}
+		self._moves = {}		# (storage, dx, dy) -> see _move()
+
+	# get the spans as cells for a window's storage
+	def _spans(self, window):
+		"""Returns, for each row, a list of (i, cells): the spans with their
+		characters made into cells for window.stage."""
+		try:
+			return self._cells[window.storage]
+		except KeyError:
+			pass
+		rows = []
+		for spans in self.spans:
+			row = []
+			for (i, text) in spans:
+				cells = [window._styled(ch, self.style) for ch in text]
+				if window._numpy:
+					cells = numpy.array(cells, dtype=numpy.uint32)
+				row.append((i, cells))
+			rows.append(row)
+		self._cells[window.storage] = rows
+		return rows
+
+	# get the opaque cells by their offsets
+	def _cell_map(self, window):
+		"""Returns {(i, j): cell} for the opaque characters, with cells for
+		window.stage."""
+		try:
+			return self._maps[window.storage]
+		except KeyError:
+			pass
+		cells = {}
+		for j, spans in enumerate(self._spans(window)):
+			for (i, row) in spans:
+				for k in range(len(row)):
+					cells[(i + k, j)] = int(row[k]) if window._numpy else row[k]
+		self._maps[window.storage] = cells
+		return cells
+
+	# get the cells that change when the sprite moves by (dx, dy)
+	def _move(self, window, dx, dy):
+		"""Returns (vacated, changed) for moving the sprite by (dx, dy):
+
+			vacated -- offsets (i, j) from the old position of the cells the
+					   sprite no longer covers
+			changed -- (i, j, cell) from the new position of the cells that
+					   were not covered, or were covered by another character
+
+		Both are worked out once per distance moved.
+		"""
+		key = (window.storage, dx, dy)
+		try:
+			return self._moves[key]
+		except KeyError:
+			pass
+		cells = self._cell_map(window)
+		vacated = [(i, j) for (i, j) in cells if (i - dx, j + dy) not in cells]
+		changed = [(i, j, cell) for ((i, j), cell) in cells.items()
+				   if cells.get((i + dx, j - dy)) != cell]
+		if len(self._moves) >= 64:
+			self._moves.clear()
+		self._moves[key] = (vacated, changed)
+		return vacated, changed
+
+
+# Uniform grid of buckets for finding Things by position
+class SpatialHash(object):
+	"""
+	An index of the Things drawn in a Window (window.things), for asking
+	which Things are at a point, in an area, or overlapping each other
+	without comparing every pair.
+
+		for (a, b) in window.things.collisions(exact=True):
+			...
+
+	The window is split into buckets of cell_width x cell_height cells and
+	each Thing is kept in the buckets its image's box touches, so a query
+	only looks at the Things in nearby buckets.  Thing.draw(), place() and
+	move() keep the index up to date (only moving into other buckets costs
+	anything), and Thing.erase() takes the Thing out.
+
+	By default Things are compared by their boxes.  With exact=True only
+	the characters the images actually draw (not the ignore characters)
+	count.
+
+	"""
+	def __init__(self, cell_width=8, cell_height=4):
+		self.cell_width = cell_width
+		self.cell_height = cell_height
+		self._buckets = {}		# (column, row) -> set of Things
+		self._entries = {}		# Thing -> (box, keys, sprite)
+
+	def __len__(self):
+		return len(self._entries)
+
+	def __iter__(self):
+		return iter(list(self._entries))
+
+	def __contains__(self, thing):
+		return thing in self._entries
+
+	# get the buckets a box touches
+	def _keys(self, box):
+		"""Returns the (column, row) of every bucket a box touches."""
+		x1, y1, x2, y2 = box
+		return [(cx, cy)
+				for cx in range(x1 // self.cell_width, x2 // self.cell_width + 1)
+				for cy in range(y1 // self.cell_height, y2 // self.cell_height + 1)]
+
+	# add a Thing, or move it to where it is now
+	def update(self, thing, position, sprite):
+		"""Indexes thing as a Sprite drawn at position (its top left
+		character)."""
+		x = int(math.floor(position[0] + 0.5))
+		y = int(math.floor(position[1] + 0.5))
+		box = (x, y - sprite.height + 1, x + sprite.width - 1, y)
+
+		old = self._entries.get(thing)
+		if old is not None and old[0] == box:
+			self._entries[thing] = (box, old[1], sprite)
+			return
+		keys = self._keys(box)
+		if old is not None:
+			if old[1] == keys:
+				self._entries[thing] = (box, keys, sprite)
+				return
+			self._unbucket(thing, old[1])
+		for key in keys:
+			self._buckets.setdefault(key, set()).add(thing)
+		self._entries[thing] = (box, keys, sprite)
+
+	# take a Thing out of the index
+	def remove(self, thing):
+		"""Removes thing from the index (if it is in it)."""
+		old = self._entries.pop(thing, None)
+		if old is not None:
+			self._unbucket(thing, old[1])
+
+	# take a Thing out of some buckets
+	def _unbucket(self, thing, keys):
+		"""Removes thing from the buckets at keys, dropping empty buckets."""
+		for key in keys:
+			bucket = self._buckets[key]
+			bucket.discard(thing)
+			if not bucket:
+				del self._buckets[key]
+
+	# get the Things in the buckets a box touches
+	def _near(self, box):
+		"""Returns the set of Things in the buckets a box touches."""
+		near = set()
+		for key in self._keys(box):
+			near.update(self._buckets.get(key, ()))
+		return near
+
+	# get the character offsets of an entry inside a box
+	def _hits(self, entry, box):
+		"""Returns True if the image of an entry draws a character inside
+		box."""
+		(x, bottom, right, y), keys, sprite = entry
+		bx1, by1, bx2, by2 = box
+		for (i, j) in sprite.mask:
+			if bx1 <= x + i <= bx2 and by1 <= y - j <= by2:
+				return True
+		return False
+
+	# get the Things at a point
+	def at(self, point, exact=False):
+		"""Returns a list of the Things whose box (or with exact=True,
+		whose image) covers an (x,y) point."""
+		x = int(math.floor(point[0] + 0.5))
+		y = int(math.floor(point[1] + 0.5))
+		return self.in_area((x, y), (x, y), exact)
+
+	# get the Things in a rectangular area
+	def in_area(self, c1, c2, exact=False):
+		"""Returns a list of the Things whose box (or with exact=True,
+		whose image) overlaps the rectangle between two opposite corners."""
+		x1, x2 = sorted([int(c1[0]), int(c2[0])])
+		y1, y2 = sorted([int(c1[1]), int(c2[1])])
+		box = (x1, y1, x2, y2)
+		found = []
+		for thing in self._near(box):
+			entry = self._entries[thing]
+			if not _boxes_overlap(entry[0], box):
+				continue
+			if exact and not self._hits(entry, box):
+				continue
+			found.append(thing)
+		return found
+
+	# get the Things overlapping a Thing
+	def colliding(self, thing, exact=False):
+		"""Returns a list of the other Things that overlap thing."""
+		entry = self._entries.get(thing)
+		if entry is None:
+			return []
+		found = []
+		for other in self._near(entry[0]):
+			if other is not thing and \
+			   self._collide(entry, self._entries[other], exact):
+				found.append(other)
+		return found
+
+	# get every pair of overlapping Things
+	def collisions(self, exact=False):
+		"""Returns a list of (thing, other) pairs for every two Things that
+		overlap.  Each pair is listed once."""
+		pairs = []
+		entries = self._entries
+		for (key, bucket) in self._buckets.items():
+			if len(bucket) < 2:
+				continue
+			things = list(bucket)
+			for n, thing in enumerate(things):
+				a = entries[thing]
+				for other in things[n+1:]:
+					b = entries[other]
+					if not _boxes_overlap(a[0], b[0]):
+						continue
+					# a pair in several buckets is only tested in the bucket
+					# holding the lower left corner of the overlap
+					x = max(a[0][0], b[0][0]) // self.cell_width
+					y = max(a[0][1], b[0][1]) // self.cell_height
+					if (x, y) == key and self._collide(a, b, exact):
+						pairs.append((thing, other))
+		return pairs
+
+	# test two entries for overlap
+	def _collide(self, a, b, exact):
+		"""Returns True if the entries a and b overlap."""
+		if not _boxes_overlap(a[0], b[0]):
+			return False
+		if not exact:
+			return True
+
+		# compare the smaller image's characters with the other's mask
+		if len(a[2].mask) > len(b[2].mask):
+			a, b = b, a
+		ax, ay = a[0][0], a[0][3]
+		bx, by = b[0][0], b[0][3]
+		mask = b[2].mask
+		for (i, j) in a[2].mask:
+			if (ax + i - bx, by - ay + j) in mask:
+				return True
+		return False
+
+
+# do two boxes (x1, y1, x2, y2) overlap?
+def _boxes_overlap(a, b):
+	return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
 
 
 # Thing to be drawn in the window
@@ -891,6 +4234,22 @@ class Thing(object):
 					 (This avoids drawing dark rectangles around an object
 					 that is not so rectangular)
 
+	IMAGE
+	self.image    -- Image in any form Window.draw() takes, or a Sprite.
+					 It is compiled into a Sprite (with the colors and
+					 ignore character above) the first time it is drawn.
+
+	LAYER
+	self.layer    -- Layer (see Window.add_layer()) the Thing is drawn on, or
+					 None to draw on the stage.  Give layer= a Layer or the
+					 name of one (it is added if the Window has none by that
+					 name).  A Thing on its own layer can move over other
+					 drawings without erasing them.
+
+	Things that are drawn are kept in their Window's window.things (a
+	SpatialHash), which finds the Things at a point, in an area or
+	colliding with each other.
+
 	"""
 	def __init__(self, window, position, *args, **kwargs):
 		"""
@@ -921,33 +4280,49 @@ class Thing(object):
 		self.on_color = kwargs.get('on_color', self.on_color)
 		self.attrs = kwargs.get('attrs', None)
 		self.image = kwargs.get('image', [['']])
-		self.size = self._get_size()
 		self.ignore = kwargs.get('ignore', None)
+		self._sprite = None			# self.image compiled (see _get_sprite())
+		self._sprite_key = None
+		self._drawn = None			# (position, sprite, generation) last drawn
+		self.size = self._get_size()
 		self.direction = kwargs.get('direction', [0,0])
 		self.speed = kwargs.get('speed', 1)
 
+		# get layer
+		self.layer = kwargs.get('layer', None)
+		if self.layer is not None and not isinstance(self.layer, Layer):
+			layer = window.layer(self.layer)
+			if layer is None:
+				layer = window.add_layer(self.layer)
+			self.layer = layer
+
 	# get size of Thing's image
 	def _get_size(self):
 		"""Returns the size of an image as a list [x-size, y-size]"""
-		self.size = [0,0]
-		image = self.image
+		sprite = self._get_sprite()
+		self.size = [sprite.width, sprite.height]
+		return self.size
+
+	# get the compiled image, compiling it again if it changed
+	def _get_sprite(self):
+		"""Returns self.image (with the Thing's colors and ignore character)
+		as a Sprite.
+
+		The Sprite is only compiled again when self.image is replaced or the
+		colors or ignore character change -- not when the image is changed
+		in place.
+		"""
+		if isinstance(self.image, Sprite):
+			return self.image
+		key = (id(self.image), self.color, self.on_color,
+			   tuple(self.attrs or ()), self.ignore)
+		if key != self._sprite_key:
+			style = self.window.style(color=self.color, on_color=self.on_color,
+									  attrs=self.attrs)
+			self._sprite = Sprite(self.image, style, self.ignore)
+			self._sprite_key = key
+		return self._sprite
 
-		# list of lists
-		if type(image) == type([0]) and type(image[0]) == type([0]):
-			self.size[0] = len(self.image[0][0])
-			self.size[1] = len(self.image)
-		# list of strings
-		elif type(image) == type([0]) and type(image[0]) == type(''):
-			self.size[0] = len(self.image[0])
-			self.size[1] = len(self.image)
-		# string
-		elif type(image) == type(''):
-			self.size[0] = len(self.image)
-			self.size[1] = 1
-		# invalid
-		else:
-			return
-			
 	# get position, direction, and speed from arguments
 	def _get_pds(self, *args, **kwargs):
 		"""Get position, direction, and speed from *args, **kwargs"""
@@ -985,21 +4360,51 @@ class Thing(object):
 		if s2 is not None:
 			self.speed = s2
 
-		window = self.window
-		window.draw(self.position, self.image,
-					color=self.color,
-					on_color=self.on_color,
-					attrs=self.attrs,
-					ignore=self.ignore)
+		window = self.window if self.layer is None else self.layer
+		sprite = self._get_sprite()
+		window._blit(self.position, sprite)
+		self._drawn = (self.position, sprite, window._generation)
+		self.window.things.update(self, self.position, sprite)
+		self._drew_over(self.position, sprite)
+
+	# mark the other Things whose cells were just drawn over or erased
+	def _drew_over(self, position, sprite):
+		"""Makes the next move() of every other Thing whose box overlaps the
+		sprite at position redraw it in full, since some of its cells may
+		not show it any more."""
+		(x, y) = (self.window._round(position[0]), self.window._round(position[1]))
+		corner = (x + sprite.width - 1, y - sprite.height + 1)
+		for thing in self.window.things.in_area((x, y), corner):
+			if thing is not self and thing._drawn is not None:
+				thing._drawn = thing._drawn[:2] + (None,)
 
 	# erase Thing's image at current position (refresh to background)
 	def erase(self):
-		"""Erase own image at coordinate self.position"""
+		"""Erase own image at coordinate self.position
+
+		Only the cells the image covers are erased (not the characters it
+		ignores).
+		"""
 		self._get_size()
-		window = self.window
-		c1 = (self.position[0], self.position[1]+1)
-		c2 = (self.position[0]+self.size[0], self.position[1]-self.size[1])
-		window.erase_area(c1, c2)
+		window = self.window if self.layer is None else self.layer
+		sprite = self._get_sprite()
+		if self._drawn is not None and self._drawn[0] == self.position:
+			sprite = self._drawn[1]
+		window._erase_sprite(self.position, sprite)
+		self._drawn = None
+		self.window.things.remove(self)
+		self._drew_over(self.position, sprite)
+
+	# advance the Thing by one tick of Window.run()
+	def tick(self, dt):
+		"""Moves the Thing by its direction and speed.
+
+		Called on every tick of Window.run() / Window.start() once the Thing
+		is added with Window.on_tick(thing).  Override it for other
+		behaviour.
+		"""
+		if self.direction[0] or self.direction[1]:
+			self.move()
 
 	# erase current position, and draw on a new coordinate
 	def place(self, coordinate):
@@ -1018,12 +4423,20 @@ class Thing(object):
 		position to a new position defined by translating over by
 			self.direction * self.speed
 
+		Only the cells that the image leaves or that change are redrawn --
+		unless something else was drawn or erased on the window (or layer)
+		since the Thing was drawn, or another Thing drew over it, in which
+		case the image is erased and drawn again in full.
+
 		"""
 		# get position, direction, and speed from *args, **kwargs
 		p2, d2, s2 = self._get_pds(*args, **kwargs)
 
-		# erase current image
-		self.erase()
+		# where the image is now
+		drawn = self._drawn
+		if drawn is None or drawn[0] != self.position:
+			self.erase()
+			drawn = None
 
 		# set any new kwargs given
 		if d2 is not None:
@@ -1042,8 +4455,616 @@ class Thing(object):
 			y += int( self.direction[1] * self.speed )
 			self.position = (x,y)
 
+		# only change the cells that differ, if the same image is on screen
+		window = self.window if self.layer is None else self.layer
+		sprite = self._get_sprite()
+		if drawn is not None and drawn[1] is sprite and \
+		   drawn[2] == window._generation:
+			window._move_sprite(sprite, drawn[0], self.position)
+			self._drawn = (self.position, sprite, window._generation)
+			self.window.things.update(self, self.position, sprite)
+			self._drew_over(drawn[0], sprite)
+			self._drew_over(self.position, sprite)
+		else:
+			if drawn is not None:
+				window._erase_sprite(drawn[0], drawn[1])
+				self._drew_over(drawn[0], drawn[1])
+			self.draw()
+
+
+# Many small Things, moved together
+class Particles(object):
+	"""
+	Thousands of small moving images (rain, stars, sparks, ...), kept in
+	NumPy arrays instead of one Thing each.
+
+		rain = Particles(window, 'blue', image='|', edges='wrap')
+		rain.add([(x, window.my-1) for x in range(1, window.mx)],
+				 direction=(0, -1), speed=0.5)
+		window.on_tick(rain)
+
+	Every particle is moved in one vectorized step per tick, keeping its
+	position to a fraction of a cell, and the edges are handled for all of
+	them at once.  Drawing is batched by image: each character of an image
+	is plotted at every particle's position in one go.
+
+		self.x, self.y   -- positions (floats) of the top left characters
+		self.dx, self.dy -- distance moved per tick (direction * speed)
+		self.kind        -- index of each particle's image in self.sprites
+		self.edges       -- what happens at the border:
+							'bounce' -- turn back            [DEFAULT]
+							'wrap'   -- come in at the other side
+							'die'    -- disappear
+							None     -- keep going (not drawn outside)
+
+	NumPy is needed.
+
+	"""
+	def __init__(self, window, *args, **kwargs):
+		"""
+		Initializes an empty particle system.  The image, colors and ignore
+		character (the same arguments as Thing) are those of kind 0; add
+		more with add_kind().
+
+		"""
+		if numpy is None:
+			raise ImportError("Particles needs NumPy")
+		self.window = window
+		self.edges = kwargs.get('edges', 'bounce')
+
+		# get layer
+		self.layer = kwargs.get('layer', None)
+		if self.layer is not None and not isinstance(self.layer, Layer):
+			layer = window.layer(self.layer)
+			if layer is None:
+				layer = window.add_layer(self.layer)
+			self.layer = layer
+
+		# images
+		self.sprites = []
+		self._sizes = numpy.zeros((0, 2), dtype=int)
+		self.add_kind(kwargs.pop('image', '.'), *args, **kwargs)
+
+		# particles
+		self.x = numpy.zeros(0)
+		self.y = numpy.zeros(0)
+		self.dx = numpy.zeros(0)
+		self.dy = numpy.zeros(0)
+		self.kind = numpy.zeros(0, dtype=int)
+
+		self._drawn = None		# (xs, ys) of the cells drawn last
+
+	def __len__(self):
+		return len(self.x)
+
+	# add an image that particles can have
+	def add_kind(self, image, *args, **kwargs):
+		"""Adds an image (with colors, like Window.draw()) and returns its
+		kind, for add()."""
+		if isinstance(image, Sprite):
+			sprite = image
+		else:
+			sprite = self.window.sprite(image, *args, **kwargs)
+		self.sprites.append(sprite)
+		self._sizes = numpy.vstack([self._sizes, [sprite.width, sprite.height]])
+		return len(self.sprites) - 1
+
+	# add particles
+	def add(self, positions, direction=(0,0), speed=1, kind=0):
+		"""Adds a particle at each (x,y) in positions.
+
+		direction is one [x_direction, y_direction] for all of them, or one
+		per particle.  speed is a number, or one per particle.
+		"""
+		positions = numpy.asarray(positions, dtype=float).reshape(-1, 2)
+		n = len(positions)
+		direction = numpy.broadcast_to(numpy.asarray(direction, dtype=float), (n, 2))
+		speed = numpy.broadcast_to(numpy.asarray(speed, dtype=float), (n,))
+
+		self.x = numpy.concatenate([self.x, positions[:, 0]])
+		self.y = numpy.concatenate([self.y, positions[:, 1]])
+		self.dx = numpy.concatenate([self.dx, direction[:, 0] * speed])
+		self.dy = numpy.concatenate([self.dy, direction[:, 1] * speed])
+		self.kind = numpy.concatenate([self.kind, numpy.full(n, kind, dtype=int)])
+
+	# remove particles
+	def remove(self, which):
+		"""Removes the particles selected by which (a boolean mask or a list
+		of indices).  They disappear from the screen on the next draw()."""
+		keep = numpy.ones(len(self.x), dtype=bool)
+		keep[which] = False
+		for name in ['x', 'y', 'dx', 'dy', 'kind']:
+			setattr(self, name, getattr(self, name)[keep])
+
+	# move every particle by one tick
+	def step(self):
+		"""Moves every particle by (dx, dy) and handles the edges, without
+		drawing."""
+		self.x += self.dx
+		self.y += self.dy
+		if self.edges is None or not len(self.x):
+			return
+
+		# range of positions (of the top left character) inside the border
+		window = self.window
+		size = self._sizes[self.kind]
+		x_lo, x_hi = 1, window.width - size[:, 0]
+		y_lo, y_hi = size[:, 1], window.height - 1
+
+		if self.edges == 'bounce':
+			self.x, self.dx = self._bounce(self.x, self.dx, x_lo, x_hi)
+			self.y, self.dy = self._bounce(self.y, self.dy, y_lo, y_hi)
+		elif self.edges == 'wrap':
+			# the half cell on each side rounds to the first and last cell
+			self.x = x_lo - 0.5 + numpy.mod(self.x - x_lo + 0.5, x_hi - x_lo + 1)
+			self.y = y_lo - 0.5 + numpy.mod(self.y - y_lo + 0.5, y_hi - y_lo + 1)
+		elif self.edges == 'die':
+			self.remove((self.x < x_lo - 0.5) | (self.x >= x_hi + 0.5) |
+						(self.y < y_lo - 0.5) | (self.y >= y_hi + 0.5))
+
+	# reflect positions that passed lo or hi, and turn them around
+	def _bounce(self, a, da, lo, hi):
+		"""Returns a and da with the values outside lo..hi reflected back
+		inside, and their da reversed."""
+		low = a < lo
+		high = a > hi
+		a = numpy.where(low, 2*lo - a, numpy.where(high, 2*hi - a, a))
+		da = numpy.where(low | high, -da, da)
+		return numpy.clip(a, lo, numpy.maximum(lo, hi)), da
+
+	# erase the particles
+	def erase(self):
+		"""Erases every cell drawn by the last draw()."""
+		if self._drawn is None:
+			return
+		xs, ys = self._drawn
+		if self.layer is None:
+			self.window._restore_array(xs, ys)
+		else:
+			for (x, y) in zip(xs.tolist(), ys.tolist()):
+				self.layer._unset(x, y)
+		self._drawn = None
+
+	# draw the particles
+	def draw(self):
+		"""Erases the particles where they were drawn last, and draws them
+		where they are now."""
+		self.erase()
+		window = self.window
+		xs = numpy.floor(self.x + 0.5).astype(int)
+		ys = numpy.floor(self.y + 0.5).astype(int)
+
+		drawn_x = []
+		drawn_y = []
+		for kind, sprite in enumerate(self.sprites):
+			if len(self.sprites) > 1:
+				mine = (self.kind == kind)
+				kind_x, kind_y = xs[mine], ys[mine]
+			else:
+				kind_x, kind_y = xs, ys
+			if not len(kind_x):
+				continue
+
+			# each character of the image, at every particle of this kind
+			for ((i, j), cell) in sprite._cell_map(window).items():
+				x = kind_x + i
+				y = kind_y - j
+				inside = (0 < x) & (x < window.width) & (0 < y) & (y < window.height)
+				x, y = x[inside], y[inside]
+				if self.layer is None:
+					window._plot_array(x, y, cell)
+				else:
+					for (cx, cy) in zip(x.tolist(), y.tolist()):
+						self.layer._set(cx, cy, cell)
+				drawn_x.append(x)
+				drawn_y.append(y)
+
+		if drawn_x:
+			self._drawn = (numpy.concatenate(drawn_x), numpy.concatenate(drawn_y))
+
+	# move and draw every particle
+	def move(self):
+		"""Moves every particle by one tick and draws them again."""
+		self.step()
+		self.draw()
+
+	# advance the particles by one tick of Window.run()
+	def tick(self, dt):
+		"""Moves the particles (see Window.on_tick())."""
+		self.move()
+
+
+# Live graph of a stream of samples
+class StripChart(object):
+	"""
+	A graph of the last samples of a live value, scrolling to the left.
+
+		load = StripChart(window, bounds=[0, 100], image='*', color='green',
+						  fill='.', axis_color='white')
+		load.push(cpu_percent())		# for every sample
+
+	or let Window.run() take the samples, with source=cpu_percent and
+	window.on_tick(load).
+
+	The samples are kept in a ring buffer with one sample per column of
+	the chart.  push() moves the chart one column to the left and only
+	draws the new column; the whole chart is only drawn again when the
+	bounds change.  Keyword arguments:
+
+		area         -- ((x1,y1), (x2,y2)), the cells of the chart (default:
+						everything inside the border)
+		bounds       -- [y_min, y_max] of the chart (default: None, to
+						grow the bounds to fit every sample)
+		axis         -- draw the x-axis (the value 0) (default: True)
+		axis_color   -- color of the axis
+		connect_dots -- join each sample to the one before with a vertical
+						line in its column (default: False)
+		fill         -- character to fill between the samples and the axis
+						with, like draw_under() (default: None)
+		fill_color   -- color of the fill
+		scroll       -- move the chart on the terminal with a scroll region
+						(see Terminal.scroll_left()), instead of printing
+						it again (default: False; needs diff=True, and a
+						terminal with left/right margins like xterm)
+		source       -- function that returns the next sample, for tick()
+
+	The other arguments are the character and colors of the samples, as
+	for plot_point() (default character '*').  Samples of None leave a
+	gap.
+
+	"""
+	def __init__(self, window, *args, **kwargs):
+		self.window = window
+		((x1, y1), (x2, y2)) = kwargs.pop('area', ((1, 1), (window.width-1,
+													   window.height-1)))
+		(self.x1, self.x2) = (min(x1, x2), max(x1, x2))
+		(self.y1, self.y2) = (min(y1, y2), max(y1, y2))
+		self.bounds = kwargs.pop('bounds', None)
+		self.autoscale = self.bounds is None
+		self.axis = kwargs.pop('axis', True)
+		self.connect_dots = kwargs.pop('connect_dots', False)
+		self.scroll = kwargs.pop('scroll', False)
+		self.source = kwargs.pop('source', None)
+
+		# cells to draw
+		axis_color = kwargs.pop('axis_color', None)
+		fill = kwargs.pop('fill', None)
+		fill_color = kwargs.pop('fill_color', None)
+		style, character = window._get_style_args(*args, **kwargs)
+		self._point = window._styled(character or '*', style)
+		self._axis = window._styled('-', window.style(axis_color))
+		self._fill = None
+		if fill is not None:
+			self._fill = window._styled(fill, window.style(fill_color))
+		self._blank = window._plain(' ')
+
+		# ring buffer of the samples, one per column
+		self.size = self.x2 - self.x1 + 1
+		self.samples = [None] * self.size
+		self._next = 0		# where the next sample goes (the oldest one)
+
 		self.draw()
 
+	def __len__(self):
+		return self.size
+
+	# get the samples, oldest first
+	def values(self):
+		"""Returns the samples in the buffer, the oldest (leftmost) first."""
+		return self.samples[self._next:] + self.samples[:self._next]
+
+	# get the row of a value
+	def _row(self, value):
+		"""Returns the row that shows value (may be outside the chart)."""
+		(y_min, y_max) = self.bounds
+		scale = (self.y2 - self.y1) / float(y_max - y_min or 1)
+		return self.window._round(self.y1 + (value - y_min) * scale)
+
+	# make the cells of one column
+	def _column(self, value, previous):
+		"""Returns the cells (from y1 up to y2) of the column of a sample."""
+		(y1, y2) = (self.y1, self.y2)
+		cells = [self._blank] * (y2 - y1 + 1)
+		if self.bounds is None:
+			return cells
+
+		axis = self._row(0)
+		if self.axis and y1 <= axis <= y2:
+			cells[axis - y1] = self._axis
+		if value is None:
+			return cells
+
+		y = self._row(value)
+		if self._fill is not None:
+			for k in range(max(min(axis, y) + 1, y1), min(max(axis, y), y2 + 1)):
+				cells[k - y1] = self._fill
+		if self.connect_dots and previous is not None:
+			p = self._row(previous)
+			for k in range(max(min(p, y), y1), min(max(p, y), y2) + 1):
+				cells[k - y1] = self._point
+		if y1 <= y <= y2:
+			cells[y - y1] = self._point
+		return cells
+
+	# put a column of cells on the stage
+	def _draw_column(self, x, value, previous):
+		window = self.window
+		cells = self._column(value, previous)
+		if window._numpy:
+			window.stage[x, self.y1:self.y2+1] = cells
+		elif window.compact:
+			window.stage[x][self.y1:self.y2+1] = array('I', cells)
+		else:
+			window.stage[x][self.y1:self.y2+1] = cells
+
+	# draw the whole chart
+	def draw(self):
+		"""Draws every column of the chart."""
+		window = self.window
+		window._own()
+		previous = None
+		for (k, value) in enumerate(self.values()):
+			self._draw_column(self.x1 + k, value, previous)
+			previous = value
+		window._touch_rows(self.y1, self.y2)
+
+	# grow the bounds to fit a value
+	def _fit(self, value):
+		"""Makes the bounds include value (with some room); returns True if
+		they changed."""
+		if self.bounds is None:
+			self.bounds = [value - 1.0, value + 1.0]
+			return True
+		(y_min, y_max) = self.bounds
+		if y_min <= value <= y_max:
+			return False
+		room = 0.1 * (max(y_max, value) - min(y_min, value))
+		if value < y_min:
+			y_min = value - room
+		else:
+			y_max = value + room
+		self.bounds = [y_min, y_max]
+		return True
+
+	# add a sample
+	def push(self, value):
+		"""Adds a sample at the right of the chart, moving the older ones one
+		column to the left."""
+		previous = self.samples[self._next - 1]
+		self.samples[self._next] = value
+		self._next = (self._next + 1) % self.size
+
+		if value is not None and self.autoscale and self._fit(value):
+			self.draw()
+			return
+
+		window = self.window
+		window._shift_left(self.x1, self.x2, self.y1, self.y2, 1, self.scroll)
+		self._draw_column(self.x2, value, previous)
+
+	# add a sample every tick of Window.run()
+	def tick(self, dt):
+		"""Pushes the value of self.source() (see Window.on_tick())."""
+		self.push(self.source())
+
+
+# A Window placed on a Screen
+class Viewport(object):
+	"""
+	Where a Window is shown on a Screen (see Screen.add()).
+
+		self.window   -- the Window
+		self.position -- (column, row) of the window's top left corner on
+						 the screen, counting from (0, 0)
+		self.z        -- viewports with a higher z are drawn over those with
+						 a lower z
+
+	"""
+	def __init__(self, window, position, z):
+		self.window = window
+		self.position = (int(position[0]), int(position[1]))
+		self.z = z
+
+
+# Several Windows sharing one terminal
+class Screen(object):
+	"""
+	Owns the terminal and shows several Windows (panels) on it, each at its
+	own position, clipped to the screen, and stacked by z.
+
+		screen = Screen()
+		log = screen.window((0, 0), [39, 20], 'cyan')
+		plot = screen.window((40, 0), [39, 20], 'green')
+		...
+		screen.display()
+
+	display() sends one frame with the changed cells of every panel, so the
+	panels never flicker separately.  Only the rows drawn on since the last
+	display are looked at, and a cell covered by a panel with a higher z
+	is never sent.
+
+	The windows should be made with headless=True (as Screen.window() does)
+	so that they do not print themselves.
+
+	"""
+	def __init__(self, terminal=None, size=None, alt_screen=False, headless=False):
+		"""
+		Initializes a Screen, clearing the terminal.
+
+		size is (columns, lines) -- default: the terminal's size, see
+		terminal_size().  With headless=True the output is thrown away
+		(unless a terminal= is given) and the size is size or DEFAULT_SIZE.
+
+		"""
+		if terminal is None:
+			if headless:
+				terminal = Terminal(_NullStream(), terminfo=False)
+			else:
+				terminal = Terminal(alt_screen=alt_screen)
+		self.terminal = terminal
+
+		if size is None:
+			size = DEFAULT_SIZE if headless else terminal_size(terminal.stream)
+		self.columns = int(size[0])
+		self.lines = int(size[1])
+
+		self.viewports = []		# lowest z first
+		self._cells = [[' '] * self.columns for r in range(self.lines)]
+		self._shown = None		# what the terminal shows (None = unknown)
+		self._dirty = set()		# screen rows changed since the last display
+		self._owner = None		# viewport shown in each cell (see _layout())
+
+		self.terminal.start()
+
+	# make a Window on the screen
+	def window(self, position, size, *args, **kwargs):
+		"""Makes a headless Window of size [width, height] (the same as
+		Window's size=), adds it at position and returns it.
+
+		z= is the viewport's z; the other arguments are Window's.
+		"""
+		z = kwargs.pop('z', 0)
+		kwargs['size'] = size
+		kwargs['headless'] = True
+		window = Window(*args, **kwargs)
+		self.add(window, position, z)
+		return window
+
+	# show a Window on the screen
+	def add(self, window, position=(0,0), z=0):
+		"""Shows window with its top left corner at position (column, row)
+		and returns its Viewport."""
+		viewport = Viewport(window, position, z)
+		self.viewports.append(viewport)
+		self._layout()
+		return viewport
+
+	# get the viewport of a Window
+	def viewport(self, window):
+		"""Returns the Viewport of window, or None."""
+		for viewport in self.viewports:
+			if viewport.window is window:
+				return viewport
+		return None
+
+	# stop showing a Window
+	def remove(self, window):
+		"""Takes window off the screen."""
+		self.viewports = [v for v in self.viewports if v.window is not window]
+		self._layout()
+
+	# move a Window on the screen
+	def move(self, window, position):
+		"""Moves window's top left corner to position (column, row)."""
+		viewport = self.viewport(window)
+		viewport.position = (int(position[0]), int(position[1]))
+		self._layout()
+
+	# move a Window up or down the stack
+	def set_z(self, window, z):
+		"""Changes the z of window's viewport."""
+		self.viewport(window).z = z
+		self._layout()
+
+	# get the screen rectangle of a viewport
+	def _bounds(self, viewport):
+		"""Returns (left, top, right, bottom) of a viewport, clipped to the
+		screen (right and bottom are exclusive)."""
+		(column, row) = viewport.position
+		window = viewport.window
+		return (max(column, 0), max(row, 0),
+				min(column + window.width + 1, self.columns),
+				min(row + window.height + 1, self.lines))
+
+	# work out which viewport shows each cell
+	def _layout(self):
+		"""Finds the top viewport of every screen cell and marks every
+		window to be composited again."""
+		self.viewports.sort(key=lambda v: v.z)
+		owner = [[None] * self.columns for r in range(self.lines)]
+		for viewport in self.viewports:
+			(left, top, right, bottom) = self._bounds(viewport)
+			if right <= left:
+				continue
+			for r in range(top, bottom):
+				owner[r][left:right] = [viewport] * (right - left)
+			viewport.window.touch_all()
+		self._owner = owner
+
+		# cells no viewport covers are blank
+		for r in range(self.lines):
+			line = self._cells[r]
+			for c in range(self.columns):
+				if owner[r][c] is None and line[c] != ' ':
+					line[c] = ' '
+					self._dirty.add(r)
+
+	# copy the changed rows of a viewport's window to the screen
+	def _update(self, viewport):
+		"""Takes the window's frame and copies the rows that changed into
+		the cells the viewport shows."""
+		window = viewport.window
+		frame, rows = window._take_frame()
+		if rows is None:
+			rows = range(window.height+1)
+		text = cell_text if window.compact else _same
+
+		(column, row) = viewport.position
+		(left, top, right, bottom) = self._bounds(viewport)
+		for y in rows:
+			r = row + window.height - y
+			if not top <= r < bottom:
+				continue
+			cells = window._row_cells(frame, y)
+			line = self._cells[r]
+			owner = self._owner[r]
+			for c in range(left, right):
+				if owner[c] is viewport:
+					line[c] = text(cells[c - column])
+			self._dirty.add(r)
+
+	# show every window
+	def display(self):
+		"""Sends the changed cells of every window to the terminal, in one
+		frame."""
+		for viewport in self.viewports:
+			if viewport.window.is_dirty():
+				self._update(viewport)
+
+		terminal = self.terminal
+		terminal.begin_frame()
+		if self._shown is None:
+			for r in range(self.lines):
+				terminal.move(r, 0)
+				terminal.write(_encode_cells(self._cells[r], terminal.rep))
+			self._shown = [line[:] for line in self._cells]
+		else:
+			for r in sorted(self._dirty):
+				new = self._cells[r]
+				old = self._shown[r]
+				for (start, end) in _changed_runs(terminal, r, new, old,
+												  rep=terminal.rep):
+					# move cursor to the start of this run of changed cells
+					terminal.move(r, start)
+					terminal.write(_encode_cells(new[start:end], terminal.rep),
+								   end - start if end < self.columns else None)
+					old[start:end] = new[start:end]
+		terminal.end_frame()
+		self._dirty.clear()
+
+	# forget what the terminal shows, so the next display repaints everything
+	def invalidate(self):
+		"""Forces the next display() to reprint the whole screen."""
+		self._shown = None
+
+	# return the terminal to normal
+	def exit(self):
+		"""Sets cursor visible, leaves the alternate screen and exits."""
+		self.terminal.stop()
+		exit()
+
+
+
 
 
 
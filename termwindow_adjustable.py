@@ -6,14 +6,9 @@ terminal window.  Plots ASCII characters in an [x][y] coordinate system.
 
 # Import modules
 import os
-import subprocess
 from time import sleep
 from copy import deepcopy
-from termcolor import colored, cprint
-
-# Get size of terminal
-WIDTH = int( subprocess.check_output(['tput','cols']) )
-HEIGHT = int( subprocess.check_output(['tput','lines']) ) - 1
+from termwindow import Terminal, terminal_size, colored
 
 
 # Display of the window
@@ -39,7 +34,7 @@ class Window(object):
 	"""
 
 	def __init__(self, border_color=None, top='=', bottom='=', left='|', right='|',
-				 position=None, size=None):
+				 position=None, size=None, terminal=None, alt_screen=False):
 		"""
 		Initialize Window
 		
@@ -56,7 +51,10 @@ class Window(object):
 		
 		"""
 		self.position = [0,0] if position is None else position
-		self.size = [WIDTH-1, HEIGHT-2] if size is None else size
+		if size is None:
+			(columns, lines) = terminal_size()
+			size = [columns-1, lines-3]
+		self.size = size
 		[self.width, self.height] = self.size
 
 		#self.width = WIDTH - 1
@@ -79,11 +77,11 @@ class Window(object):
 		self.blank = []
 		self.background = []
 
-		# clear screen
-		os.system('clear')
-
-		# Hide the cursor
-		self.hide_cursor()
+		# clear screen and hide the cursor
+		if terminal is None:
+			terminal = Terminal(alt_screen=alt_screen)
+		self.terminal = terminal
+		self.terminal.start()
 
 		# create blank window stage
 		for x in range(self.width+1):
@@ -115,22 +113,16 @@ class Window(object):
 	# print the window in terminal
 	def display(self):
 		"""Refreshes the image of the stage."""
-		# Bring cursor back up to top left corner
-		os.system('tput cup {} {}'.format(self.position[1], self.position[0]))
+		terminal = self.terminal
+		terminal.begin_frame()
 
-		# print
+		# print each row at the window's position
 		for row in range(self.height+1):
-			#os.system('tput cup {} {}'.format(self.position[0]+row, self.position[1]))
-
-			col_string = ''
-			for col in range(self.width+1):
-				col_string += self.stage[col][(self.height - row)]
-			print col_string
+			terminal.move(self.position[1] + row, self.position[0])
+			y = self.height - row
+			terminal.write(''.join([self.stage[col][y] for col in range(self.width+1)]))
 
-			# move cursor right
-			os.system('tput cuf {}'.format(self.position[0]))
-			# move cursor down
-			#os.system('tput cud {}'.format(1))
+		terminal.end_frame()
 
 
 	# set stage as background
@@ -146,19 +138,17 @@ class Window(object):
 	# make cursor invisible
 	def hide_cursor(self):
 		"""Sets cursor to invisible."""
-		os.system('echo "\x1b[?25l"')
-		return
+		self.terminal.hide_cursor()
 
 	# make cursor visible again
 	def show_cursor(self):
 		"""Sets cursor back to visible."""
-		os.system('echo "\x1b[?25h"')
-		return
+		self.terminal.show_cursor()
 
 	# show cursor and exit gracefully
 	def exit(self):
-		"""Sets cursor visible and exits."""
-		self.show_cursor()
+		"""Sets cursor visible, leaves the alternate screen and exits."""
+		self.terminal.stop()
 		exit()
 
 	# set background so self.erase() will just erase the foreground
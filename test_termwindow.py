@@ -0,0 +1,755 @@
+import json
+import math
+import os
+import re
+import random
+import shutil
+import signal
+import sys
+import tempfile
+import unittest
+from array import array
+from fractions import Fraction
+
+try:
+	import asyncio
+except ImportError:
+	asyncio = None
+
+try:
+	unichr
+except NameError:
+	unichr = chr
+
+import termwindow
+from termwindow import Window, Thing, Style, Terminal, RenderThread, cell_text
+
+STORAGES = ['strings', 'compact'] + (['numpy'] if termwindow.numpy else [])
+
+
+# the plain characters of row y, without their color codes
+def row(window, y):
+	frame = window._composite()
+	text = cell_text if window.compact else str
+	return re.sub('\x1b\\[[0-9;]*m', '',
+		''.join(text(frame[x][y]) for x in range(window.width)))
+
+
+# a cell as (text, escape prefix) -- what a terminal shows for it
+def split_cell(text):
+	match = re.match('((?:\x1b\\[[0-9;]*m)*)(.*?)(?:\x1b\\[0m)?$', text)
+	return (match.group(2), match.group(1))
+
+# what the window should look like on the terminal, a row at a time
+def expected_screen(window):
+	frame = window._composite()
+	text = cell_text if window.compact else str
+	return [[split_cell(text(cell)) for cell in window._row_cells(frame, y)]
+			for y in range(window.height, -1, -1)]
+
+
+# A terminal that keeps the character and the colors of every cell
+class TerminalModel(object):
+	"""
+	Just enough of a terminal to follow what a Window sends: cursor
+	addressing and motion, SGR, REP, and the scroll region, margins and
+	DECDC of Terminal.scroll_left().
+	"""
+	def __init__(self, columns, lines):
+		self.columns = columns
+		self.cells = [[(' ', '')] * columns for r in range(lines)]
+		self.row = self.col = 0
+		self.sgr = ''
+		self.last = ' '
+		self.region = None
+		self.margins = None
+		self.scrolls = 0
+
+	def write(self, data):
+		i = 0
+		while i < len(data):
+			match = re.match("\x1b\\[([?0-9;]*)('?[A-Za-z~])", data[i:])
+			if match is None:
+				self._char(data[i])
+				i += 1
+				continue
+			self._sequence(match.group(1), match.group(2), match.group(0))
+			i += len(match.group(0))
+
+	def flush(self):
+		pass
+
+	def fileno(self):
+		raise IOError('no terminal')
+
+	def _char(self, ch):
+		if ch == '\r':
+			self.col = 0
+		elif ch == '\n':
+			self.row += 1
+			self.col = 0
+		else:
+			if self.col < self.columns:
+				self.cells[self.row][self.col] = (ch, self.sgr)
+			self.col += 1
+			self.last = ch
+
+	def _sequence(self, args, final, sequence):
+		if args.startswith('?'):
+			return
+		n = [int(a) if a else 0 for a in args.split(';')] if args else []
+		count = n[0] if n and n[0] else 1
+		if final == 'H':
+			self.row = (n[0] if n else 1) - 1
+			self.col = (n[1] if len(n) > 1 else 1) - 1
+		elif final == 'm':
+			self.sgr = '' if n in ([], [0]) else self.sgr + sequence
+		elif final == 'A':
+			self.row -= count
+		elif final == 'B':
+			self.row += count
+		elif final == 'C':
+			self.col += count
+		elif final == 'D':
+			self.col -= count
+		elif final == 'b':
+			for k in range(count):
+				self._char(self.last)
+		elif final == 'r':
+			self.region = (n[0] - 1, n[1] - 1) if n else None
+		elif final == 's':
+			self.margins = (n[0] - 1, n[1] - 1) if n else None
+		elif final == "'~":
+			(top, bottom) = self.region
+			(left, right) = self.margins
+			for r in range(top, bottom + 1):
+				line = self.cells[r]
+				part = line[self.col:right + 1]
+				line[self.col:right + 1] = part[count:] + [(' ', '')] * count
+			self.scrolls += 1
+
+	def screen(self, window):
+		"""Returns the cells of the terminal the window covers."""
+		return [line[:window.width + 1] for line in
+				self.cells[:window.height + 1]]
+
+
+# draw some random points, lines and areas
+def scribble(window, rng, styles):
+	for k in range(rng.randint(1, 6)):
+		style = rng.choice(styles)
+		character = rng.choice('#*o.')
+		x1 = rng.randint(1, window.width - 1)
+		x2 = rng.randint(1, window.width - 1)
+		y1 = rng.randint(1, window.height - 1)
+		y2 = rng.randint(1, window.height - 1)
+		shape = rng.randint(0, 3)
+		if shape == 0:
+			window.plot_point((x1, y1), character, style=style)
+		elif shape == 1:
+			# (plot_line() needs x1 != x2; vertical lines are drawn apart)
+			if x1 == x2:
+				x2 = x1 - 1 if x1 > 1 else x1 + 1
+			window.plot_line((x1, y1), (x2, y2), character, style=style)
+		elif shape == 2:
+			window.plot_area((x1, y1), (x2, y2), character, style=style)
+		else:
+			window.erase_area((x1, y1), (x2, y2))
+
+
+# tests of the escape sequences sent, with termcolor coloring even when
+# the output is not a terminal
+class ColorTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.environ = dict(os.environ)
+		os.environ['FORCE_COLOR'] = '1'
+
+	def tearDown(self):
+		os.environ.clear()
+		os.environ.update(self.environ)
+
+
+class OutputTest(ColorTestCase):
+
+	def setUp(self):
+		ColorTestCase.setUp(self)
+		# (styles of their own, so nothing was painted without colors yet)
+		self.styles = [Style(), Style('magenta', 'on_cyan', ['underline']),
+					   Style('cyan', attrs=['bold', 'reverse'])]
+
+	def window(self, model, storage, rep, size=[30, 10]):
+		terminal = Terminal(model, terminfo=False, sync=False, rep=rep)
+		return Window(size=size, terminal=terminal, diff=True,
+					  storage=storage)
+
+	def test_diff_frames(self):
+		for storage in STORAGES:
+			for rep in (False, True):
+				model = TerminalModel(31, 12)
+				window = self.window(model, storage, rep)
+				rng = random.Random(1)
+				for frame in range(30):
+					scribble(window, rng, self.styles)
+					window.display()
+					self.assertEqual(model.screen(window),
+									 expected_screen(window),
+									 (storage, rep, frame))
+
+	def test_cursor_motion(self):
+		terminal = Terminal(TerminalModel(1, 1), terminfo=False)
+		for (from_row, from_col) in [(0, 0), (3, 7), (11, 30)]:
+			for row in range(12):
+				for col in range(0, 31, 3):
+					model = TerminalModel(31, 12)
+					(model.row, model.col) = (from_row, from_col)
+					motion = terminal.motion(row, col, from_row, from_col)
+					model.write(motion)
+					self.assertEqual((model.row, model.col), (row, col))
+					self.assertTrue(len(motion) <= len(terminal.cup(row, col)))
+
+	def test_rep(self):
+		for storage in STORAGES:
+			model = TerminalModel(31, 12)
+			window = self.window(model, storage, True)
+			window.display()
+			window.plot_area((2, 3), (25, 3), '=')
+			data = []
+			window.terminal.stream = Recording(model, data)
+			window.display()
+			self.assertTrue('\x1b[23b' in ''.join(data), data)
+			self.assertEqual(model.screen(window), expected_screen(window))
+
+	def test_one_prefix_per_style_run(self):
+		for storage in STORAGES:
+			model = TerminalModel(31, 12)
+			window = self.window(model, storage, False)
+			window.display()
+			(plain, magenta, cyan) = self.styles
+			window.plot_area((2, 3), (9, 3), 'a', style=magenta)
+			window.plot_area((10, 3), (14, 3), 'b', style=cyan)
+			window.plot_area((15, 3), (20, 3), 'c', style=plain)
+			data = []
+			window.terminal.stream = Recording(model, data)
+			window.display()
+			data = ''.join(data)
+			self.assertEqual(data.count(magenta.prefix), 1, data)
+			self.assertEqual(data.count(cyan.prefix), 1, data)
+			self.assertEqual(model.screen(window), expected_screen(window))
+
+	def test_scroll(self):
+		for storage in STORAGES:
+			for scroll in (False, True):
+				model = TerminalModel(31, 12)
+				window = self.window(model, storage, False)
+				rng = random.Random(2)
+				scribble(window, rng, self.styles)
+				window.display()
+				for frame in range(10):
+					window._shift_left(1, window.width - 1, 1,
+									   window.height - 1, 2, scroll=scroll)
+					window.plot_point((window.width - 1, frame % 8 + 1), '@',
+									  style=self.styles[1])
+					window.display()
+					self.assertEqual(model.screen(window),
+									 expected_screen(window),
+									 (storage, scroll, frame))
+				self.assertEqual(model.scrolls, 10 if scroll else 0)
+
+	def test_resize_between_frames(self):
+		for storage in STORAGES:
+			for size in ([40, 10], [30, 14], [20, 6], [36, 8]):
+				model = TerminalModel(41, 16)
+				window = self.window(model, storage, True)
+				rng = random.Random(3)
+				scribble(window, rng, self.styles)
+				window.display()
+				window.resize(size)
+				scribble(window, rng, self.styles)
+				window.display()
+				self.assertEqual(model.screen(window),
+								 expected_screen(window), (storage, size))
+
+	# the screen should show each panel's cells, clipped, with the higher z
+	# on top, as panels are drawn on, moved, restacked and removed
+	def test_screen(self):
+		for storage in STORAGES:
+			model = TerminalModel(50, 18)
+			terminal = Terminal(model, terminfo=False, sync=False, rep=True)
+			screen = termwindow.Screen(terminal=terminal, size=(50, 18))
+			windows = [screen.window((2, 1), [20, 8], storage=storage),
+					   screen.window((15, 5), [24, 10], storage=storage, z=1),
+					   screen.window((-4, 12), [16, 9], storage=storage),
+					   screen.window((40, -3), [14, 7], storage=storage,
+									 z=2)]
+			rng = random.Random(4)
+			for frame in range(20):
+				for window in rng.sample(windows, 2):
+					scribble(window, rng, self.styles)
+				if frame == 8:
+					screen.move(windows[0], (10, 3))
+				elif frame == 12:
+					screen.set_z(windows[0], 3)
+				elif frame == 16:
+					screen.remove(windows[1])
+				screen.display()
+
+				expected = [[(' ', '')] * 50 for r in range(18)]
+				for viewport in screen.viewports:
+					(column, top) = viewport.position
+					for (r, line) in enumerate(
+							expected_screen(viewport.window)):
+						for (c, cell) in enumerate(line):
+							if 0 <= top + r < 18 and 0 <= column + c < 50:
+								expected[top + r][column + c] = cell
+				self.assertEqual(model.cells, expected, (storage, frame))
+
+	# after every push the chart should look as if it was drawn from
+	# scratch with the same samples, on the stage and on the terminal
+	def test_strip_chart(self):
+		options = dict(area=((3, 2), (24, 8)), color='magenta', fill='.',
+					   fill_color='cyan', axis_color='white',
+					   connect_dots=True)
+		for storage in STORAGES:
+			for scroll in (False, True):
+				for bounds in (None, [-5, 10]):
+					model = TerminalModel(31, 12)
+					window = self.window(model, storage, True)
+					window.plot_area((1, 1), (29, 9), '#')
+					chart = termwindow.StripChart(window, bounds=bounds,
+												  scroll=scroll, **options)
+					window.display()
+					rng = random.Random(5)
+					for k in range(40):
+						value = rng.choice([None, rng.uniform(-6, 12)])
+						dropped = chart.values()[0]
+						before = chart.bounds and list(chart.bounds)
+						chart.push(value)
+						window.display()
+
+						redrawn = Window(size=[30, 10], headless=True,
+										 storage=storage)
+						redrawn.plot_area((1, 1), (29, 9), '#')
+						again = termwindow.StripChart(
+							redrawn, bounds=list(chart.bounds), **options)
+						again.samples = chart.values()
+						again.draw()
+						# (unless the bounds changed, the oldest column still
+						# joins the sample that scrolled off)
+						if chart.bounds == before:
+							again._draw_column(again.x1, again.samples[0],
+											   dropped)
+						self.assertEqual(expected_screen(window),
+										 expected_screen(redrawn),
+										 (storage, scroll, bounds, k))
+						self.assertEqual(model.screen(window),
+										 expected_screen(window),
+										 (storage, scroll, bounds, k))
+					self.assertEqual(model.scrolls > 0, scroll)
+
+
+# a stream that keeps what is written to it, and passes it on
+class Recording(object):
+	def __init__(self, stream, data):
+		self.stream = stream
+		self.data = data
+
+	def write(self, text):
+		self.data.append(text)
+		self.stream.write(text)
+
+	def flush(self):
+		pass
+
+
+class StorageTest(ColorTestCase):
+
+	# draw the same scene in every storage mode
+	def scenes(self, storages):
+		windows = []
+		for storage in storages:
+			data = []
+			terminal = Terminal(Recording(TerminalModel(31, 12), data),
+								terminfo=False, rep=True)
+			window = Window(size=[30, 10], terminal=terminal, diff=True,
+							storage=storage)
+			rng = random.Random(4)
+			styles = [Style(), Style('blue'), Style('green', 'on_white'),
+					  Style(attrs=['dark'])]
+			for frame in range(10):
+				scribble(window, rng, styles)
+				window.plot_point((frame + 1, 9), u'\u00e9\u2588'[frame % 2],
+								  style=styles[frame % 4])
+				window.display()
+			windows.append((window, ''.join(data)))
+		return windows
+
+	def assertSameOutput(self, storages):
+		windows = self.scenes(storages)
+		(first, output) = windows[0]
+		for (window, data) in windows[1:]:
+			self.assertEqual(expected_screen(window), expected_screen(first),
+							 window.storage)
+			self.assertEqual(data, output, window.storage)
+
+	def test_compact_matches_strings(self):
+		self.assertSameOutput(['strings', 'compact'])
+
+	@unittest.skipIf(termwindow.numpy is None, 'needs NumPy')
+	def test_numpy_matches_strings(self):
+		self.assertSameOutput(['strings', 'numpy'])
+
+	def test_glyph_bits(self):
+		style = Style('yellow', attrs=['underline'])
+		for code in [0, 0x7f, 0xff, 0x100, 0xffff, sys.maxunicode]:
+			character = unichr(code)
+			cell = termwindow.compact_cell(character, style)
+			self.assertEqual(cell >> termwindow.GLYPH_BITS, style.id)
+			self.assertEqual(cell & termwindow.GLYPH_MASK, code)
+			self.assertEqual(cell_text(cell), style.paint(character))
+		self.assertTrue(sys.maxunicode <= termwindow.GLYPH_MASK)
+		largest = ((termwindow.MAX_STYLES - 1) << termwindow.GLYPH_BITS) | \
+				  termwindow.GLYPH_MASK
+		self.assertEqual(array('I', [largest])[0], largest)
+		if termwindow.numpy is not None:
+			cells = termwindow.numpy.array([largest], dtype=termwindow.numpy.uint32)
+			self.assertEqual(int(cells[0]), largest)
+
+
+class RecordingTest(ColorTestCase):
+
+	def setUp(self):
+		ColorTestCase.setUp(self)
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+		ColorTestCase.tearDown(self)
+
+	# the time of every frame in a recording
+	def frame_times(self, path):
+		f = termwindow._open_recording(path, 'rb')
+		try:
+			records = [json.loads(line.decode('utf-8')) for line in f][1:]
+		finally:
+			f.close()
+		return [record.get('k', record.get('d')) for record in records]
+
+	def test_round_trip(self):
+		styles = [Style(), Style('yellow'), Style('white', 'on_blue')]
+		for storage in STORAGES:
+			for name in ('frames.rec', 'frames.rec.gz'):
+				path = os.path.join(self.directory, name)
+				window = Window(size=[30, 10], headless=True, diff=True,
+								storage=storage)
+				recorder = window.record(path, keyframe_every=5)
+				rng = random.Random(6)
+				screens = []
+				for frame in range(20):
+					if frame == 10:
+						window.resize([34, 12])
+					scribble(window, rng, styles)
+					window.display()
+					screens.append(expected_screen(window))
+				window.stop_recording()
+
+				times = self.frame_times(path)
+				self.assertEqual(len(times), recorder.frames)
+				replay = Window(size=[1, 1], headless=True, diff=True)
+				replayer = termwindow.Replayer(path, replay)
+				self.assertEqual(replayer.frames, 20)
+				for k in [19, 0, 7, 10, 3, 15]:
+					replayer.seek(times[k])
+					self.assertEqual(expected_screen(replay), screens[k],
+									 (storage, name, k))
+				replayer.play(speed=None, start=0)
+				self.assertEqual(expected_screen(replay), screens[-1])
+				replayer.close()
+
+
+@unittest.skipIf(termwindow.numpy is None, 'needs NumPy')
+class ParticlesTest(unittest.TestCase):
+
+	def particles(self, edges):
+		window = Window(size=[30, 12], headless=True)
+		particles = termwindow.Particles(window, image='o', edges=edges)
+		rng = random.Random(8)
+		particles.add([(rng.uniform(1, 29), rng.uniform(1, 11))
+					   for k in range(40)],
+					  direction=[(rng.uniform(-1, 1), rng.uniform(-1, 1))
+								 for k in range(40)], speed=1.7)
+		return window, particles
+
+	# the stage should show an 'o' at each particle, and nothing else
+	def assertDrawn(self, window, particles):
+		cells = set()
+		for (x, y) in zip(particles.x.tolist(), particles.y.tolist()):
+			(x, y) = (int(math.floor(x + 0.5)), int(math.floor(y + 0.5)))
+			if 0 < x < window.width and 0 < y < window.height:
+				cells.add((x, y))
+		for y in range(1, window.height):
+			line = row(window, y)
+			for x in range(1, window.width):
+				self.assertEqual(line[x], 'o' if (x, y) in cells else ' ',
+								 (x, y))
+
+	def test_bounce(self):
+		window, particles = self.particles('bounce')
+		for tick in range(50):
+			particles.move()
+			self.assertTrue((particles.x >= 1).all())
+			self.assertTrue((particles.x <= window.width - 1).all())
+			self.assertTrue((particles.y >= 1).all())
+			self.assertTrue((particles.y <= window.height - 1).all())
+			self.assertDrawn(window, particles)
+		self.assertEqual(len(particles), 40)
+
+	def test_wrap(self):
+		window, particles = self.particles('wrap')
+		for tick in range(50):
+			particles.move()
+			self.assertDrawn(window, particles)
+		self.assertEqual(len(particles), 40)
+
+	def test_die_and_erase(self):
+		window, particles = self.particles('die')
+		for tick in range(50):
+			particles.move()
+			self.assertDrawn(window, particles)
+		self.assertEqual(len(particles), 0)
+		window, particles = self.particles(None)
+		particles.move()
+		particles.erase()
+		for y in range(1, window.height):
+			self.assertEqual(row(window, y)[1:window.width],
+							 ' ' * (window.width - 1))
+
+
+class SpatialHashTest(unittest.TestCase):
+
+	IMAGES = [['/-\\', '| |', '\\-/'], 'ab c', [' x ', 'xxx', ' x '], 'o']
+
+	# the cells a Thing covers: its whole box, or only the characters drawn
+	def cells(self, thing, exact):
+		x, y = int(thing.position[0]), int(thing.position[1])
+		sprite = thing._get_sprite()
+		if exact:
+			return set((x + i, y - j) for (i, j) in sprite.mask)
+		return set((x + i, y - j) for i in range(sprite.width)
+				   for j in range(sprite.height))
+
+	# Things wander on and off the stage (and below zero), and every query
+	# should match a brute-force test of their cells
+	def test_matches_brute_force(self):
+		window = Window(size=[40, 16], headless=True)
+		rng = random.Random(3)
+		def spot():
+			return (rng.randint(-6, window.width + 4),
+					rng.randint(-4, window.height + 4))
+		things = [Thing(window, spot(), image=rng.choice(self.IMAGES),
+						ignore=' ') for k in range(60)]
+		for thing in things:
+			thing.draw()
+		for tick in range(15):
+			for thing in rng.sample(things, 30):
+				r = rng.random()
+				if r < 0.1:
+					thing.erase()
+				elif r < 0.3:
+					thing.place(spot())
+				else:
+					thing.move(direction=[rng.randint(-3, 3),
+										  rng.randint(-2, 2)])
+			live = [t for t in things if t in window.things]
+			self.assertEqual(len(window.things), len(live))
+			for exact in (False, True):
+				cells = dict((t, self.cells(t, exact)) for t in live)
+				pairs = set(frozenset((a, b))
+							for (n, a) in enumerate(live)
+							for b in live[n+1:] if cells[a] & cells[b])
+				found = window.things.collisions(exact)
+				self.assertEqual(len(found), len(pairs))
+				self.assertEqual(set(frozenset(p) for p in found), pairs)
+				for thing in live[:10]:
+					self.assertEqual(
+						set(window.things.colliding(thing, exact)),
+						set(o for o in live if o is not thing and
+							cells[o] & cells[thing]))
+				for q in range(10):
+					(x, y) = spot()
+					self.assertEqual(
+						set(window.things.at((x, y), exact)),
+						set(t for t in live if (x, y) in cells[t]))
+					(x2, y2) = (x + rng.randint(-8, 8), y + rng.randint(-4, 4))
+					area = set((i, j)
+							   for i in range(min(x, x2), max(x, x2) + 1)
+							   for j in range(min(y, y2), max(y, y2) + 1))
+					self.assertEqual(
+						set(window.things.in_area((x, y), (x2, y2), exact)),
+						set(t for t in live if cells[t] & area))
+
+
+class ThingMoveTest(unittest.TestCase):
+
+	def test_move_after_erase_redraws_whole_sprite(self):
+		for storage in ('strings', 'compact'):
+			window = Window(size=[20, 8], headless=True, storage=storage)
+			thing = Thing(window, (3, 4), image='####')
+			thing.draw()
+			window.erase()
+			thing.move(direction=[1, 0])
+			self.assertEqual(row(window, 4)[3:9], ' #### ')
+
+	def test_move_after_other_thing_left(self):
+		for storage in ('strings', 'compact'):
+			window = Window(size=[20, 8], headless=True, storage=storage)
+			a = Thing(window, (3, 4), image='AAAA')
+			a.draw()
+			b = Thing(window, (5, 4), image='B')
+			b.draw()
+			b.move(position=(5, 6))
+			a.move(direction=[1, 0])
+			self.assertEqual(row(window, 4)[3:9], ' AAAA ')
+
+
+class LayerTest(unittest.TestCase):
+
+	def test_points_on_two_layers_in_one_row(self):
+		for storage in ('strings', 'compact'):
+			window = Window(size=[20, 8], headless=True, storage=storage)
+			a = window.add_layer('a')
+			b = window.add_layer('b')
+			window.display()
+			a.plot_point((5, 5), 'A')
+			b.plot_point((10, 5), 'B')
+			self.assertEqual(row(window, 5)[5:11], 'A    B')
+
+
+class ConnectDotsTest(unittest.TestCase):
+
+	def test_style_keyword(self):
+		window = Window(size=[20, 8], headless=True)
+		window.connect_dots([(2, 2), (8, 2)], '*', wrap=False,
+							style=Style('red'))
+		self.assertEqual(row(window, 2)[2:9], '*******')
+
+
+class RasterizerTest(unittest.TestCase):
+
+	def test_matches_float_path(self):
+		window = Window(size=[60, 30], headless=True)
+		rng = random.Random(5)
+		# (away from the border, which the float path may just miss)
+		for k in range(2000):
+			(x1, y1) = p1 = (rng.randint(2, 58), rng.randint(2, 28))
+			(x2, y2) = p2 = (rng.randint(2, 58), rng.randint(2, 28))
+			if x1 == x2:
+				continue
+			old = set([(int(x + 0.5), int(y + 0.5))
+					   for (x, y) in window._define_line(p1, p2)])
+			xs, ys = window.rasterize_line(p1, p2)
+			new = set(zip(xs, ys))
+			# (the float path may round an exact .5 either way)
+			for (x, y) in old ^ new:
+				if abs(x2 - x1) >= abs(y2 - y1):
+					exact = Fraction(y1) + Fraction((x - x1) * (y2 - y1), x2 - x1)
+				else:
+					exact = Fraction(x1) + Fraction((y - y1) * (x2 - x1), y2 - y1)
+				self.assertEqual(exact.denominator, 2, (p1, p2, (x, y)))
+
+	def test_draw_under_image(self):
+		for storage in STORAGES:
+			for delay in (None, 0):
+				window = Window(size=[30, 12], headless=True, storage=storage)
+				window.draw_under([(5, 6)], origin=(0, 2), delay=delay,
+								  image='ab')
+				self.assertEqual(row(window, 4)[4:8], ' ab ')
+
+
+class FrameStatsTest(unittest.TestCase):
+
+	def test_display_after_growing(self):
+		window = Window(size=[20, 8], headless=True)
+		stats = window.enable_stats()
+		window.display()
+		window.resize([20, 12])
+		window.display()
+		self.assertEqual(len(stats.frames), 2)
+
+
+class StyleTest(unittest.TestCase):
+
+	def test_plain_style_paints_the_character(self):
+		self.assertEqual(Style().paint('x'), 'x')
+		self.assertEqual(Style().prefix, '')
+
+	def test_invalid_attrs(self):
+		self.assertRaises(KeyError, Style, attrs=['bogus'])
+		self.assertRaises(KeyError, Style, 'bogus')
+		for storage in ('strings', 'compact'):
+			window = Window(size=[20, 8], headless=True, storage=storage)
+			window.plot_point((3, 3), 'x', attrs=['bogus'])
+			window.plot_point((4, 3), 'y', attrs='bold')
+			window.display()
+			self.assertEqual(row(window, 3)[3:5], 'xy')
+
+	def test_terminal_size_names(self):
+		self.assertTrue(termwindow.WIDTH > 0)
+		self.assertTrue(termwindow.HEIGHT > 0)
+
+
+@unittest.skipIf(asyncio is None, 'needs asyncio')
+class RenderLoopTest(unittest.TestCase):
+
+	def test_resize_while_idle(self):
+		window = Window(size=[20, 8], headless=True)
+		window.display()
+		environ = dict(os.environ)
+		os.environ.update(COLUMNS='31', LINES='13')
+		handler = signal.getsignal(signal.SIGWINCH)
+		try:
+			window.watch_resize()
+			def tick(dt):
+				if window.render_loop.ticks == 2:
+					os.kill(os.getpid(), signal.SIGWINCH)
+			window.on_tick(tick)
+			window.run(50, None, 0.2)
+		finally:
+			signal.signal(signal.SIGWINCH, handler)
+			os.environ.clear()
+			os.environ.update(environ)
+		self.assertEqual((window.width, window.height), (30, 10))
+
+	def test_handler_exception_ends_run(self):
+		window = Window(size=[20, 8], headless=True)
+		def tick(dt):
+			raise ValueError('tick')
+		window.on_tick(tick)
+		self.assertRaises(ValueError, window.run, 50, None, 5)
+
+
+class SharedGridTest(unittest.TestCase):
+
+	def test_reading_keeps_columns_shared(self):
+		window = Window(size=[20, 8], headless=True)
+		window.erase()
+		window.erase_point((3, 3))
+		self.assertTrue(all(window.stage._shared))
+		self.assertTrue(window.stage.column(3) is window.background[3])
+
+
+class RenderThreadTest(unittest.TestCase):
+
+	def test_only_drawing_methods_are_queued(self):
+		window = Window(size=[20, 8], headless=True)
+		renderer = RenderThread(window)
+		try:
+			self.assertRaises(AttributeError, getattr, renderer, 'is_dirty')
+			renderer.plot_point((3, 3), 'x')
+		finally:
+			renderer.stop()
+		self.assertEqual(row(window, 3)[3], 'x')
+
+
+if __name__ == '__main__':
+	unittest.main()